@@ -1,12 +1,18 @@
 import streamlit as st
 import os
+import re
 import time
 from groq import Groq
-from ml_engine.downloader import VideoDownloader
-from ml_engine.processing import VideoProcessor
-from ml_engine.audio import AudioTranscriber
-from ml_engine.vision import VideoVision
-from ml_engine.store import VectorDB
+# torch / whisper / clip / cv2 / yt_dlp are only imported when a model or tool is first used
+from ml_engine.registry import REGISTRY, Lazy
+from ml_engine.library import VideoLibrary, make_video_id
+from ml_engine.cache import FeatureCache, hash_file, save_stream
+from ml_engine.keyword_index import KeywordIndex, reciprocal_rank_fusion, map_segments_to_windows, drop_overlapping, tokenize
+from ml_engine.manifest import JobManifest
+from ml_engine.previews import PreviewStore
+from ml_engine.summarizer import TranscriptSummarizer
+from ml_engine.search import aggregate_hits
+from ml_engine.metrics import METRICS
 
 # --- 1. CONFIGURATION & ADVANCED STYLING ---
 st.set_page_config(page_title="VideoIQ Pro", layout="wide", initial_sidebar_state="collapsed")
@@ -103,23 +109,85 @@ st.markdown("""
 # API Key
 GROQ_API_KEY = "Enter your GROQ API Key Here"
 
+# Vector storage: "qdrant" (default) or "numpy" (in-process memmap engine)
+VECTOR_BACKEND = os.environ.get("VIDEOIQ_VECTOR_BACKEND", "qdrant")
+
+# Model precision on CPU: "fp32" or "int8" (dynamic quantization, checked against fp32 at load)
+MODEL_PRECISION = os.environ.get("VIDEOIQ_PRECISION", "fp32")
+
+# Speech vectors: "windows" (overlapping merged segments) or "segments" (one per Whisper segment)
+SPEECH_INDEX = os.environ.get("VIDEOIQ_SPEECH_INDEX", "windows")
+
+# Result cards: thumbnails (default) or short low-bitrate clips cut on first view
+PREVIEW_CLIPS = os.environ.get("VIDEOIQ_PREVIEW_CLIPS", "0") == "1"
+
 # Helper Function: Time Formatting
 def format_time(seconds):
     minutes = int(seconds // 60)
     rem_seconds = int(seconds % 60)
     return f"{minutes}m {rem_seconds}s"
 
+# Helper Function: Bold the query terms in a transcript line
+def highlight_terms(text, query):
+    terms = tokenize(query)
+    if not terms:
+        return text
+    return re.sub(r"\b(" + "|".join(map(re.escape, terms)) + r")\b", r"**\1**", text, flags=re.IGNORECASE)
+
+# Helper Function: Resolve the playable file for a video id (may be another video in the library)
+def video_file_path(video_id):
+    video = tools["library"].get(video_id)
+    return video["path"] if video else st.session_state['file_path']
+
+# Helper Function: Result card preview; the full player only loads when "Play" is clicked
+def play_at(video_id, timestamp):
+    st.session_state['player'] = (video_file_path(video_id), int(timestamp))
+
+def render_preview(video_id, timestamp, key):
+    video = tools["library"].get(video_id)
+    if not (video and video["is_audio"]):
+        if PREVIEW_CLIPS:
+            clip = tools["previews"].clip(video_id, timestamp, video_file_path(video_id),
+                                          ffmpeg=tools["processor"]._get_ffmpeg_path())
+            if clip:
+                st.video(clip)
+        else:
+            thumb = tools["previews"].thumbnail(video_id, timestamp, video_file_path(video_id))
+            if thumb:
+                st.image(thumb, use_container_width=True)
+    st.button("▶️ Play", key=key, on_click=play_at, args=(video_id, timestamp))
+
 # --- 2. ENGINE SETUP ---
 @st.cache_resource
 def load_tools():
-    return {
-        "downloader": VideoDownloader(),
-        "processor": VideoProcessor(),
-        "audio": AudioTranscriber(),
-        "vision": VideoVision(),
-        "db": VectorDB(),
+    # Heavy objects are lazy handles on the process-wide registry: nothing loads until first use
+    # (or the background preload below), and every session shares one copy
+    tools = {
+        "downloader": REGISTRY.lazy("downloader"),
+        "processor": REGISTRY.lazy("processor"),
+        "audio": REGISTRY.lazy("audio", precision=MODEL_PRECISION),
+        "vision": REGISTRY.lazy("vision", precision=MODEL_PRECISION),
+        "db": REGISTRY.lazy("db", backend=VECTOR_BACKEND),
+        "library": VideoLibrary(),
+        "cache": FeatureCache(),
+        "keywords": KeywordIndex(),
+        "previews": PreviewStore(),
         "llm": Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
     }
+    tools["summarizer"] = TranscriptSummarizer(tools["llm"], cache=tools["cache"]) if tools["llm"] else None
+
+    def build_pipeline():
+        from ml_engine.pipeline import IngestionPipeline
+        return IngestionPipeline(tools["processor"], tools["audio"], tools["vision"], tools["db"],
+                                 cache=tools["cache"], keyword_index=tools["keywords"],
+                                 previews=tools["previews"], speech_index=SPEECH_INDEX, library=tools["library"])
+    tools["pipeline"] = Lazy(build_pipeline)
+    return tools
+
+# Search needs CLIP + the DB first, Whisper only matters once a video is analyzed.
+# First query shouldn't pay for the text encoder's lazy init either (warm_up).
+def preload_models():
+    REGISTRY.preload([tools["db"], lambda: tools["vision"].warm_up(), tools["audio"], tools["processor"], tools["pipeline"]])
 
 tools = load_tools()
 
@@ -207,12 +275,15 @@ elif st.session_state.page == "main":
         st.markdown("</div>", unsafe_allow_html=True)
         
         if uploaded:
-            os.makedirs("temp_data", exist_ok=True)
-            save_path = os.path.join("temp_data", uploaded.name)
-            with open(save_path, "wb") as f:
-                f.write(uploaded.getbuffer())
-            st.session_state['temp_file_path'] = save_path
-            st.session_state['temp_is_audio'] = uploaded.name.endswith(('mp3', 'wav'))
+            # Only write (and hash) a new upload once, not on every rerun
+            if st.session_state.get('temp_upload_id') != uploaded.file_id:
+                os.makedirs("temp_data", exist_ok=True)
+                save_path = os.path.join("temp_data", uploaded.name)
+                # Hash while writing so the cache key costs no extra pass over the file
+                st.session_state['temp_content_hash'] = save_stream(uploaded, save_path)
+                st.session_state['temp_upload_id'] = uploaded.file_id
+                st.session_state['temp_file_path'] = save_path
+                st.session_state['temp_is_audio'] = uploaded.name.endswith(('mp3', 'wav'))
             st.success(f"Ready: {uploaded.name}")
 
     with col_link:
@@ -246,98 +317,82 @@ elif st.session_state.page == "main":
         # --- STEP 1: DOWNLOAD (0% -> 10%) ---
         status_text.markdown("** Fetching media...**")
         if 'yt_url' in st.session_state and st.session_state['yt_url']:
-            path, audio_mode = tools["downloader"].download_from_url(st.session_state['yt_url'])
-            if not path:
-                status_text.error("❌ Error: Download failed.")
-                st.stop()
-            target_path = path
-            processing_audio_mode = audio_mode
+            source = st.session_state['yt_url']
+            video_id = make_video_id(source)
+            manifest = JobManifest(video_id)
+            if manifest.get("file_path") and os.path.exists(manifest.get("file_path")):
+                # Downloaded by an earlier (possibly interrupted) run
+                target_path = manifest.get("file_path")
+                processing_audio_mode = manifest.get("is_audio")
+                content_hash = manifest.get("content_hash")
+            else:
+                path, audio_mode = tools["downloader"].download_from_url(source)
+                if not path:
+                    status_text.error("❌ Error: Download failed.")
+                    st.stop()
+                target_path = path
+                processing_audio_mode = audio_mode
+                content_hash = hash_file(target_path)
+                manifest.update(file_path=target_path, is_audio=audio_mode, content_hash=content_hash)
         elif 'temp_file_path' in st.session_state:
             target_path = st.session_state['temp_file_path']
             processing_audio_mode = st.session_state['temp_is_audio']
+            source = target_path
+            content_hash = st.session_state['temp_content_hash']
+            # Stable id per source, so re-analysis only replaces this video's points
+            video_id = content_hash[:16]
+            manifest = JobManifest(video_id)
         else:
             status_text.error("❌ Error: No file found.")
             st.stop()
         
         st.session_state['file_path'] = target_path
         st.session_state['is_audio'] = processing_audio_mode
+        st.session_state['video_id'] = video_id
+        st.session_state.pop('player', None)
         
-        # Smooth fill to 10%
-        for i in range(1, 11):
-            progress_bar.progress(i)
-            time.sleep(0.02) 
-
-        # --- STEP 2: TRANSCRIPTION (10% -> 30%) ---
-        status_text.markdown("** Transcribing audio track...**")
-        # Reset DB first
-        tools["db"].reset_db()
-        clean_audio = tools["processor"].extract_audio(target_path)
-        transcript = tools["audio"].transcribe(clean_audio)
-        
-        # Jump to 30% (Transcription is a single block process)
-        progress_bar.progress(30)
-
-        # --- STEP 3: AUDIO EMBEDDINGS (30% -> 50% SMOOTH LOOP) ---
-        if transcript:
-            status_text.markdown("** Processing speech intelligence...**")
-            st.session_state['transcript_segments'] = transcript
-            st.session_state['transcript_text'] = " ".join([s['text'] for s in transcript])
-            
-            # Process one by one for smooth bar movement
-            total_segs = len(transcript)
-            audio_vecs = []
-            audio_payloads = []
-            
-            for idx, s in enumerate(transcript):
-                # Generate embedding
-                v = tools["vision"].get_text_embedding(s['text'])
-                audio_vecs.append(v)
-                audio_payloads.append({"timestamp": s['start'], "text": s['text'], "type": "speech"})
-                
-                # Calculate progress: Map 0-total_segs to 30-50 range
-                prog = 30 + int((idx / total_segs) * 20)
-                progress_bar.progress(prog)
-            
-            # Batch upload to DB
-            tools["db"].upload_vectors(audio_vecs, audio_payloads, "audio_search")
-        
-        progress_bar.progress(50)
+        progress_bar.progress(10)
 
-        # --- STEP 4: VISUAL PROCESSING (50% -> 100% SMOOTH LOOP) ---
-        if not processing_audio_mode:
-            status_text.markdown("** Analyzing visual frames (AI Vision)...**")
-            
-            # Extract Frames
-            frames = tools["processor"].extract_keyframes(target_path, interval=1)
-            
-            if frames:
-                total_frames = len(frames)
-                frame_vecs = []
-                frame_payloads = []
-                
-                # Loop through frames to update bar smoothly
-                for idx, f in enumerate(frames):
-                    # Generate embedding
-                    v = tools["vision"].get_image_embedding(f)
-                    frame_vecs.append(v)
-                    frame_payloads.append({"timestamp": idx*1, "path": f, "type": "frame"})
-                    
-                    # Calculate progress: Map 0-total_frames to 50-100 range
-                    prog = 50 + int((idx / total_frames) * 50)
-                    progress_bar.progress(prog)
-                
-                tools["db"].upload_vectors(frame_vecs, frame_payloads, "visual_search")
-        else:
-            # If audio only, just fill to end
-            status_text.info("Audio file detected. Skipping visual analysis.")
-            progress_bar.progress(100)
+        # --- STEP 2: AUDIO + VISUAL INGESTION (background job, searchable while it runs) ---
+        # Register first so hits on the partial index resolve to this file; the pipeline
+        # marks the entry complete at the end, so an interrupted run isn't taken as indexed
+        tools["library"].add(video_id, source, target_path, is_audio=processing_audio_mode, complete=False)
+        st.session_state.pop('transcript_segments', None)
+        st.session_state.pop('transcript_text', None)
+        # An interrupted earlier run of the same video resumes from its checkpoints
+        st.session_state['job'] = tools["pipeline"].start(target_path, video_id, content_hash=content_hash,
+                                                          is_audio=processing_audio_mode, manifest=manifest)
 
-        # FINISH
-        progress_bar.progress(100)
-        status_text.success("✅ Analysis Complete!")
+        status_text.success("✅ Analysis started! Results become searchable as they are indexed.")
         st.session_state.analysis_complete = True
         time.sleep(1)
         st.rerun()
+
+    # --- INGESTION STATUS (while the background job runs) ---
+    job = st.session_state.get('job')
+    if job is not None:
+        if job.done:
+            if job.error:
+                st.error(f"❌ Analysis failed: {job.error}")
+                # Drop everything the failed run stored, a retry starts from scratch
+                failed_id = st.session_state['video_id']
+                tools["library"].remove(failed_id)
+                tools["previews"].remove_video(failed_id)
+                tools["db"].delete_video(failed_id)
+                tools["keywords"].remove_video(failed_id)
+                JobManifest(failed_id).reset()
+            elif job.result["transcript"]:
+                transcript = job.result["transcript"]
+                st.session_state['transcript_segments'] = transcript
+                st.session_state['transcript_text'] = " ".join([s['text'] for s in transcript])
+            st.session_state['job'] = None
+        else:
+            st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+            st.markdown("### ⚙️ Processing Video Intelligence")
+            st.progress(10 + int(job.progress * 90))
+            st.caption(f"{job.message or 'Working...'} Everything indexed so far is already searchable.")
+            st.button("🔄 Refresh progress")
+            st.markdown('</div>', unsafe_allow_html=True)
         
         
     # ==========================================
@@ -350,9 +405,12 @@ elif st.session_state.page == "main":
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
         st.markdown("###  Intelligence Results")
         
-        # Video Player
-        if 'file_path' in st.session_state:
-            st.video(st.session_state['file_path'])
+        # Video Player (one instance, loaded on demand)
+        if st.session_state.get('player'):
+            player_path, player_start = st.session_state['player']
+            st.video(player_path, start_time=player_start)
+        elif 'file_path' in st.session_state:
+            st.button("▶️ Play video", on_click=play_at, args=(st.session_state['video_id'], 0))
 
         tab1, tab2 = st.tabs(["🔎 Semantic Search", "📝 Smart Summary"])
 
@@ -360,95 +418,102 @@ elif st.session_state.page == "main":
         with tab1:
             st.markdown("<br>", unsafe_allow_html=True)
             query = st.text_input("Ask your video:", placeholder="e.g. 'Show me the part with the red car' or 'When do they talk about pricing?'")
+            scope = st.radio("Search in", ["This video", f"Whole library ({len(tools['library'])} videos)"], horizontal=True, label_visibility="collapsed")
+            scope_ids = st.session_state.get('video_id') if scope == "This video" else None
             
             if query and tools["db"]:
-                query_vec = tools["vision"].get_text_embedding(query)
+                query_vec = tools["vision"].embed_query(query)
+                audio_vector_hits = tools["db"].search(query_vec, "audio_search", top_k=20, video_ids=scope_ids)
                 
                 # --- VISUAL RESULTS ---
-                if not st.session_state.get('is_audio', False):
+                if scope_ids is None or not st.session_state.get('is_audio', False):
                     st.markdown("##### 🖼️ Visual Matches")
-                    results = tools["db"].search(query_vec, "visual_search", top_k=12)
+                    # Over-fetch frames and merge neighbours into scenes; speech in the same range boosts it
+                    frame_hits = tools["db"].search(query_vec, "visual_search", top_k=48, video_ids=scope_ids)
+                    ranges = aggregate_hits({"visual": frame_hits, "audio": audio_vector_hits})
+                    results = [r for r in ranges if "visual" in r["scores"]][:6]
                     
                     if results:
                         GRID_SIZE = 3 
                         for i in range(0, len(results), GRID_SIZE):
                             batch = results[i : i + GRID_SIZE]
                             cols = st.columns(GRID_SIZE)
-                            for idx, hit in enumerate(batch):
-                                timestamp = hit.payload['timestamp']
-                                score = hit.score
-                                time_str = format_time(timestamp)
+                            for idx, scene in enumerate(batch):
+                                time_str = f"{format_time(scene['start'])} - {format_time(scene['end'])}"
                                 
                                 with cols[idx]:
-                                    st.video(st.session_state['file_path'], start_time=int(timestamp))
-                                    st.caption(f"**{time_str}**")
+                                    render_preview(scene['video_id'], scene['best'], key=f"visual_{i + idx}")
+                                    st.caption(f"**{time_str}**" + (" | also said here" if "audio" in scene["scores"] else ""))
                     else:
                         st.info("No visual matches found.")
                     st.divider()
 
                 # --- AUDIO RESULTS ---
                 st.markdown("##### 🗣️ Audio Matches")
-                found_audio = False
-                
-                # 1. Exact Match
-                if 'transcript_segments' in st.session_state:
-                    exact_matches = [s for s in st.session_state['transcript_segments'] if query.lower() in s['text'].lower()]
-                    if exact_matches:
-                        found_audio = True
-                        st.success(f"Found {len(exact_matches)} exact spoken matches.")
-                        for match in exact_matches[:5]:
-                            time_str = format_time(match['start'])
-                            with st.container():
-                                c1, c2 = st.columns([3, 1])
-                                with c1:
-                                    # Highlight Logic
-                                    clean_text = match['text']
-                                    highlight_text = clean_text.replace(query, f"**{query}**").replace(query.lower(), f"**{query.lower()}**").replace(query.capitalize(), f"**{query.capitalize()}**")
-                                    st.markdown(f"**🗣️ Said:** ... {highlight_text} ...")
+                audio_mode = st.radio("Audio ranking", ["Hybrid", "Keyword", "Semantic"], horizontal=True, label_visibility="collapsed")
+
+                # 1. Keyword candidates: BM25 over the inverted index ("quotes" for exact phrases)
+                keyword_hits = []
+                if audio_mode != "Semantic":
+                    keyword_hits = [doc for _, doc in tools["keywords"].search(query, top_k=20, video_ids=scope_ids)]
+
+                # 2. Semantic candidates from the audio vector collection (overlapping transcript windows)
+                windows = [{"video_id": hit.payload.get('video_id'), "start": hit.payload['timestamp'],
+                            "end": hit.payload.get('end', hit.payload['timestamp']), "text": hit.payload['text'],
+                            "segment_ids": hit.payload.get('segment_ids', [])}
+                           for hit in audio_vector_hits]
+                vector_hits = windows if audio_mode != "Keyword" else []
+                if audio_mode == "Hybrid":
+                    # BM25 ranks single segments; move each onto its window so both lists agree on keys
+                    keyword_hits = map_segments_to_windows(keyword_hits, windows)
+
+                # 3. One ranked list (reciprocal rank fusion when both are present), overlapping windows collapsed
+                fused = [item for _, item in reciprocal_rank_fusion([keyword_hits, vector_hits], top_k=20)]
+                audio_results = drop_overlapping(fused, top_k=5)
+                keyword_keys = {(d['video_id'], round(d['start'], 2)) for d in keyword_hits}
+
+                if audio_results:
+                    for match in audio_results:
+                        time_str = format_time(match['start'])
+                        with st.container():
+                            c1, c2 = st.columns([3, 1])
+                            with c1:
+                                if (match['video_id'], round(match['start'], 2)) in keyword_keys:
+                                    st.markdown(f"**🗣️ Said:** ... {highlight_terms(match['text'], query)} ...")
                                     st.caption(f"Time: {time_str}")
-                                with c2:
-                                    st.video(st.session_state['file_path'], start_time=int(match['start']))
-                                st.divider()
-
-                # 2. Semantic Fallback
-                if not found_audio:
-                    st.caption("Searching for similar meanings...")
-                    audio_results = tools["db"].search(query_vec, "audio_search", top_k=5)
-                    if audio_results:
-                        for hit in audio_results:
-                            text_content = hit.payload['text']
-                            timestamp = hit.payload['timestamp']
-                            time_str = format_time(timestamp)
-                            with st.container():
-                                c1, c2 = st.columns([3, 1])
-                                with c1:
-                                    st.info(f"\"{text_content}\"")
+                                else:
+                                    st.info(f"\"{match['text']}\"")
                                     st.caption(f"Time: {time_str} | Contextual Match")
-                                with c2:
-                                    st.video(st.session_state['file_path'], start_time=int(timestamp))
-                                st.divider()
-                    else:
-                        st.info("No audio matches found.")
+                            with c2:
+                                render_preview(match['video_id'], match['start'], key=f"audio_{match['video_id']}_{match['start']}")
+                            st.divider()
+                else:
+                    st.info("No audio matches found.")
 
         # --- TAB 2: SUMMARY ---
         with tab2:
             st.markdown("<br>", unsafe_allow_html=True)
             if st.button(" Generate AI Summary"):
-                if 'transcript_text' in st.session_state and tools["llm"]:
+                if st.session_state.get('transcript_segments') and tools["summarizer"]:
                     with st.spinner("Analyzing narrative structure..."):
-                        context_text = st.session_state['transcript_text']
-                        prompt = f"""
-                        Transcript: <transcript>{context_text}</transcript>
-                        Task: Create a beautiful, structured summary. Use Markdown headers and bullet points.
-                        """
-                        completion = tools["llm"].chat.completions.create(
-                            messages=[{"role": "user", "content": prompt}],
-                            model="llama-3.3-70b-versatile"
-                        )
-                        st.markdown(completion.choices[0].message.content)
+                        # Long transcripts are summarized per time chunk, then merged (cached per chunk)
+                        summary_bar = st.progress(0)
+                        summary = tools["summarizer"].summarize(st.session_state['transcript_segments'],
+                                                                progress_callback=lambda f, _: summary_bar.progress(min(int(f * 100), 100)))
+                        summary_bar.empty()
+                        st.markdown(summary)
                 else:
                     st.error("Transcript missing.")
         
         st.markdown('</div>', unsafe_allow_html=True) # End Results Card
     
-    st.markdown('</div>', unsafe_allow_html=True) # End Main Animation Container
\ No newline at end of file
+    # --- PIPELINE METRICS (timings + counters, Prometheus text format) ---
+    with st.expander("📊 Pipeline metrics"):
+        metrics_text = METRICS.prometheus_text()
+        st.code(metrics_text, language="text")
+        st.download_button("Download metrics", metrics_text, file_name="videoiq_metrics.prom")
+
+    st.markdown('</div>', unsafe_allow_html=True) # End Main Animation Container
+
+# --- BACKGROUND PRELOAD (once per process, after the first page has been sent) ---
+preload_models()
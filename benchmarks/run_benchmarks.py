@@ -0,0 +1,359 @@
+# File: benchmarks/run_benchmarks.py
+"""
+Offline benchmark harness for the ml_engine pipeline.
+
+    python benchmarks/run_benchmarks.py --stub-models --sizes 1000,10000
+    python benchmarks/run_benchmarks.py --duration 600 --sizes 1000,10000,100000
+
+Synthesizes test media (cv2.VideoWriter video with scene cuts, speech-like
+audio with pauses), times every stage in isolation and end to end, and writes
+a machine-readable JSON report to benchmarks/results/. --stub-models swaps
+Whisper and CLIP for cheap deterministic stand-ins so CI-sized runs take
+seconds and need no model downloads.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+try:
+    import resource
+except ImportError:
+    # Windows has no getrusage, peak memory is reported as null there
+    resource = None
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_engine.processing import VideoProcessor, SAMPLE_RATE
+from ml_engine.dedup import FrameDeduplicator
+from ml_engine.store import VectorDB
+from ml_engine.pipeline import IngestionPipeline
+from ml_engine.metrics import METRICS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FOLDER = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# --- Synthetic media ---
+def make_video(path, duration, fps=25, size=(640, 360), scene_seconds=8):
+    """Moving shapes over a background that changes every scene_seconds (gives dedup something to do)"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    rng = np.random.default_rng(0)
+    width, height = size
+    for i in range(int(duration * fps)):
+        scene = int(i / fps / scene_seconds)
+        color = np.random.default_rng(scene).integers(0, 255, 3)
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = color
+        x = int((i * 4) % width)
+        cv2.circle(frame, (x, height // 2), 40, (255, 255, 255), -1)
+        cv2.putText(frame, f"scene {scene}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        frame += rng.integers(0, 3, frame.shape, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+
+def make_speech_like_audio(path, duration, seed=0):
+    """Harmonic bursts with a syllable-rate envelope and silent pauses, 16 kHz mono 16-bit"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    voice = sum(np.sin(2 * np.pi * k * np.cumsum(pitch) / SAMPLE_RATE) / k for k in range(1, 6))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    # ~6 s of talking, ~3 s of silence
+    talking = (t % 9) < 6
+    samples = 0.3 * voice * syllables * talking + 0.002 * rng.standard_normal(len(t))
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+def read_wav(path):
+    with wave.open(path, "rb") as f:
+        raw = f.readframes(f.getnframes())
+    return np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+
+# --- Model stand-ins ---
+class StubVision:
+    """Deterministic CLIP stand-in: random projection of a 16x16 thumbnail / hashed text"""
+    model_name = "stub"
+    cache_tag = "stub"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.projection = np.random.default_rng(0).standard_normal((16 * 16 * 3, dim)).astype(np.float32)
+
+    def get_image_embeddings(self, frames, batch_size=32, progress_callback=None):
+        thumbs = np.stack([cv2.resize(f, (16, 16)).ravel() for f in frames]).astype(np.float32) / 255.0
+        vecs = thumbs @ self.projection
+        METRICS.inc("frames_embedded", len(frames))
+        return np.ascontiguousarray(vecs, dtype=np.float32)
+
+    def iter_image_embeddings(self, frame_stream, batch_size=32):
+        keys, frames = [], []
+        for key, frame in frame_stream:
+            keys.append(key)
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield keys, self.get_image_embeddings(frames)
+                keys, frames = [], []
+        if frames:
+            yield keys, self.get_image_embeddings(frames)
+
+    def get_text_embedding(self, text):
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def get_text_embeddings(self, texts, batch_size=256, progress_callback=None):
+        METRICS.inc("segments_embedded", len(texts))
+        return np.array([self.get_text_embedding(t) for t in texts], dtype=np.float32)
+
+    embed_query = get_text_embedding
+
+class StubTranscriber:
+    """Whisper stand-in: one segment per 3 s of audio that isn't silent"""
+    model_size = "stub"
+    cache_tag = "stub"
+
+    def transcribe(self, audio):
+        samples = audio if isinstance(audio, np.ndarray) else read_wav(audio)
+        step = 3 * SAMPLE_RATE
+        segments = []
+        for start in range(0, len(samples), step):
+            if np.sqrt(np.mean(samples[start:start + step] ** 2)) > 0.01:
+                segments.append({"id": len(segments), "start": start / SAMPLE_RATE,
+                                 "end": min(start + step, len(samples)) / SAMPLE_RATE,
+                                 "text": f"synthetic segment number {len(segments)}"})
+        METRICS.inc("segments_transcribed", len(segments))
+        return segments
+
+class SidecarAudioProcessor(VideoProcessor):
+    """Reads the generated WAV directly when ffmpeg is not installed"""
+    def __init__(self, wav_path, **kwargs):
+        super().__init__(**kwargs)
+        self.wav_path = wav_path
+
+    def decode_audio(self, input_path):
+        return read_wav(self.wav_path)
+
+# --- Measurement helpers ---
+def peak_rss_mb():
+    """Process high-water mark so far (monotonic across stages), None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def timed(fn):
+    started = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - started
+
+def percentiles(latencies):
+    ms = np.array(latencies) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=REPO_ROOT).stdout.strip() or None
+    except Exception:
+        return None
+
+# --- Stages ---
+def bench_frame_sampling(processor, video_path, interval):
+    frames, seconds = timed(lambda: list(processor.iter_keyframes(video_path, interval=interval)))
+    return frames, {"frames": len(frames), "seconds": seconds, "frames_per_s": len(frames) / seconds,
+                    "peak_rss_mb": peak_rss_mb()}
+
+def bench_dedup(frames):
+    dedup = FrameDeduplicator()
+    kept, seconds = timed(lambda: list(dedup.filter(iter(frames))))
+    return {"frames_in": len(frames), "frames_kept": len(kept), "seconds": seconds,
+            "frames_per_s": len(frames) / seconds, "peak_rss_mb": peak_rss_mb()}
+
+def bench_image_embedding(vision, frames, batch_size):
+    vecs, seconds = timed(lambda: vision.get_image_embeddings([f for _, f in frames], batch_size=batch_size))
+    return {"embeddings": len(vecs), "seconds": seconds, "embeddings_per_s": len(vecs) / seconds,
+            "peak_rss_mb": peak_rss_mb()}
+
+def bench_audio(processor, transcriber, vision, media_path):
+    samples, decode_seconds = timed(lambda: processor.decode_audio(media_path))
+    result = {"decode_seconds": decode_seconds}
+    if samples is None:
+        result["error"] = "audio decode failed"
+        return result
+    audio_seconds = len(samples) / SAMPLE_RATE
+    result["audio_seconds"] = audio_seconds
+    result["decode_x_realtime"] = audio_seconds / decode_seconds if decode_seconds else None
+
+    try:
+        from ml_engine.audio import find_speech_chunks
+        chunks, chunk_seconds = timed(lambda: find_speech_chunks(samples))
+        result["speech_chunks"] = len(chunks)
+        result["speech_chunking_seconds"] = chunk_seconds
+    except ImportError:
+        pass
+
+    segments, seconds = timed(lambda: transcriber.transcribe(samples))
+    result.update({"segments": len(segments), "transcribe_seconds": seconds,
+                   "segments_per_s": len(segments) / seconds if seconds else None,
+                   "transcribe_x_realtime": audio_seconds / seconds if seconds else None})
+
+    texts = [s["text"] for s in segments]
+    if texts:
+        vecs, seconds = timed(lambda: vision.get_text_embeddings(texts))
+        result.update({"text_embeddings": len(vecs), "text_embed_seconds": seconds,
+                       "text_embeddings_per_s": len(vecs) / seconds if seconds else None})
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def bench_search(backend, size, queries, top_k, workdir, dim=512, videos=50):
+    rng = np.random.default_rng(size)
+    path = os.path.join(workdir, f"{backend}_{size}")
+    db = VectorDB(backend=backend, path=path)
+
+    vectors = rng.standard_normal((size, dim)).astype(np.float32)
+    payloads = [{"timestamp": float(i), "type": "frame"} for i in range(size)]
+    build_started = time.perf_counter()
+    for start in range(0, size, 5000):
+        video_id = f"video_{(start // 5000) % videos}"
+        db.upload_vectors(vectors[start:start + 5000], payloads[start:start + 5000], "visual_search", video_id=video_id)
+    build_seconds = time.perf_counter() - build_started
+
+    query_vecs = rng.standard_normal((queries, dim)).astype(np.float32)
+    # Warm-up query so lazy loading isn't counted
+    db.search(query_vecs[0].tolist(), "visual_search", top_k=top_k)
+
+    latencies = []
+    for q in query_vecs:
+        _, seconds = timed(lambda: db.search(q.tolist(), "visual_search", top_k=top_k))
+        latencies.append(seconds)
+    filtered = []
+    for q in query_vecs:
+        _, seconds = timed(lambda: db.search(q.tolist(), "visual_search", top_k=top_k, video_ids="video_0"))
+        filtered.append(seconds)
+
+    return {"backend": backend, "size": size, "build_seconds": build_seconds,
+            "vectors_per_s": size / build_seconds, "queries": queries, "top_k": top_k,
+            "search": percentiles(latencies), "filtered_search": percentiles(filtered),
+            "peak_rss_mb": peak_rss_mb()}
+
+def bench_end_to_end(processor, transcriber, vision, media_path, interval, workdir):
+    db = VectorDB(backend="numpy", path=os.path.join(workdir, "e2e_db"))
+    pipeline = IngestionPipeline(processor, transcriber, vision, db, frame_interval=interval)
+    result, seconds = timed(lambda: pipeline.run(media_path, "bench"))
+    return {"seconds": seconds, "segments": result["segments"], "frames": result["frames"],
+            "peak_rss_mb": peak_rss_mb()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VideoIQ ingestion and search pipeline.")
+    parser.add_argument("--duration", type=float, default=120, help="seconds of synthetic media")
+    parser.add_argument("--interval", type=float, default=1, help="frame sampling interval")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--sizes", default="1000,10000", help="collection sizes for search benchmarks")
+    parser.add_argument("--backends", default="numpy,qdrant")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--stub-models", action="store_true", help="replace Whisper/CLIP with fast stand-ins")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8"], help="real models only")
+    parser.add_argument("--skip", default="", help="comma list of stages to skip: video,audio,search,e2e")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/bench_<utc>.json)")
+    args = parser.parse_args(argv)
+    skip = set(filter(None, args.skip.split(",")))
+
+    workdir = tempfile.mkdtemp(prefix="videoiq_bench_")
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "numpy": np.__version__, "opencv": cv2.__version__},
+        "config": vars(args),
+        "stages": {},
+    }
+
+    try:
+        print(f"🎬 Synthesizing {args.duration:.0f}s of test media in {workdir}...")
+        video_path = os.path.join(workdir, "video.mp4")
+        wav_path = os.path.join(workdir, "audio.wav")
+        make_video(video_path, args.duration)
+        make_speech_like_audio(wav_path, args.duration)
+
+        ffmpeg = shutil.which("ffmpeg")
+        media_path = video_path
+        if ffmpeg:
+            media_path = os.path.join(workdir, "media.mp4")
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", video_path, "-i", wav_path,
+                            "-c:v", "copy", "-c:a", "aac", "-shortest", media_path], check=True)
+            processor = VideoProcessor(temp_folder=workdir)
+        else:
+            print("ℹ️ ffmpeg not found, audio stages read the generated WAV directly.")
+            processor = SidecarAudioProcessor(wav_path, temp_folder=workdir)
+        report["environment"]["ffmpeg"] = bool(ffmpeg)
+
+        print("🧠 Loading models..." if not args.stub_models else "🧪 Using stub models.")
+        if args.stub_models:
+            vision, transcriber = StubVision(), StubTranscriber()
+            load_seconds = 0.0
+        else:
+            from ml_engine.vision import VideoVision
+            from ml_engine.audio import AudioTranscriber
+            (vision, transcriber), load_seconds = timed(lambda: (VideoVision(precision=args.precision),
+                                                                  AudioTranscriber(precision=args.precision)))
+        report["stages"]["model_load"] = {"seconds": load_seconds, "stub": args.stub_models, "peak_rss_mb": peak_rss_mb(),
+                                          "precision": getattr(vision, "precision", None)}
+
+        if "video" not in skip:
+            print("🖼️ Frame sampling / dedup / image embedding...")
+            frames, report["stages"]["frame_sampling"] = bench_frame_sampling(processor, video_path, args.interval)
+            report["stages"]["dedup"] = bench_dedup(frames)
+            report["stages"]["image_embedding"] = bench_image_embedding(vision, frames, args.batch_size)
+            del frames
+
+        if "audio" not in skip:
+            print("🔊 Audio decode / transcription / text embedding...")
+            report["stages"]["audio"] = bench_audio(processor, transcriber, vision, media_path)
+
+        if "search" not in skip:
+            report["stages"]["search"] = []
+            for backend in filter(None, args.backends.split(",")):
+                for size in [int(s) for s in args.sizes.split(",") if s]:
+                    print(f"🔎 Search: {backend} @ {size} vectors...")
+                    try:
+                        report["stages"]["search"].append(bench_search(backend, size, args.queries, args.top_k, workdir))
+                    except ImportError as e:
+                        report["stages"]["search"].append({"backend": backend, "size": size, "error": str(e)})
+
+        if "e2e" not in skip:
+            print("⚙️ End-to-end ingestion...")
+            report["stages"]["end_to_end"] = bench_end_to_end(processor, transcriber, vision, media_path,
+                                                              args.interval, workdir)
+
+        report["metrics"] = METRICS.snapshot()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f"bench_{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report["stages"], indent=2))
+    print(f"📄 Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
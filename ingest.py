@@ -0,0 +1,219 @@
+# File: ingest.py
+"""
+Headless bulk ingestion.
+
+    python ingest.py videos/ talks.txt https://youtube.com/watch?v=... --workers 4
+
+Inputs can be media files, directories (scanned recursively), URLs, or
+@list files with one path/URL per line. Models are loaded once per worker
+process; the vector DB and library are only touched by the main process
+because local Qdrant allows a single writer.
+
+With --backend numpy this can run while the app is open: the library,
+keyword index and collections are written under file locks and re-read
+first. With Qdrant, close the app (it holds ./qdrant_db) before running.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".avi")
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac")
+
+# --- Worker side ---
+_tools = None
+
+class RecordingDB:
+    """Stands in for VectorDB inside workers, the main process replays the calls"""
+    def __init__(self):
+        self.calls = []
+
+    def delete_video(self, video_id):
+        self.calls.append(("delete_video", (video_id,), {}))
+
+    def upload_vectors(self, vectors, payloads, collection_name, video_id=None):
+        self.calls.append(("upload_vectors", (vectors, payloads, collection_name), {"video_id": video_id}))
+
+def _init_worker(frame_interval, whisper_model, whisper_workers, decode_workers, speech_index, precision):
+    global _tools
+    from ml_engine.downloader import VideoDownloader
+    from ml_engine.processing import VideoProcessor
+    from ml_engine.audio import AudioTranscriber
+    from ml_engine.vision import VideoVision
+    from ml_engine.cache import FeatureCache
+    from ml_engine.previews import PreviewStore
+
+    processor = VideoProcessor()
+    _tools = {
+        "downloader": VideoDownloader(),
+        "processor": processor,
+        "audio": AudioTranscriber(whisper_model, workers=whisper_workers, precision=precision),
+        "vision": VideoVision(precision=precision),
+        "cache": FeatureCache(),
+        # Thumbnails are plain files, so workers write them directly
+        "previews": PreviewStore(),
+        "frame_interval": frame_interval,
+        "decode_workers": decode_workers,
+        "speech_index": speech_index,
+    }
+
+def _ingest_one(item):
+    from ml_engine.cache import hash_file
+    from ml_engine.pipeline import IngestionPipeline
+    from ml_engine.metrics import METRICS
+
+    # Per-item metrics travel back to the parent with the report
+    METRICS.reset()
+    started = time.perf_counter()
+    source, video_id = item["source"], item["video_id"]
+
+    if item["is_url"]:
+        file_path, is_audio = _tools["downloader"].download_from_url(source)
+        if not file_path:
+            raise RuntimeError(f"Download failed: {source}")
+    else:
+        file_path, is_audio = source, source.lower().endswith(AUDIO_EXTENSIONS)
+    downloaded = time.perf_counter()
+
+    db = RecordingDB()
+    pipeline = IngestionPipeline(_tools["processor"], _tools["audio"], _tools["vision"], db,
+                                 cache=_tools["cache"], frame_interval=_tools["frame_interval"],
+                                 decode_workers=_tools["decode_workers"], previews=_tools["previews"],
+                                 speech_index=_tools["speech_index"])
+    # Local files were already hashed by the main process for their video id
+    content_hash = item["content_hash"] or hash_file(file_path)
+    result = pipeline.run(file_path, video_id, content_hash=content_hash, is_audio=is_audio)
+
+    return {
+        "source": source,
+        "video_id": video_id,
+        "file_path": file_path,
+        "is_audio": is_audio,
+        "segments": result["segments"],
+        "frames": result["frames"],
+        "transcript": result["transcript"],
+        "download_seconds": downloaded - started,
+        "seconds": time.perf_counter() - started,
+        "db_calls": db.calls,
+        "metrics": METRICS.snapshot(),
+    }
+
+# --- Main process ---
+def expand_inputs(inputs):
+    """Turns files, directories, URLs and @list files into a flat list of sources"""
+    sources = []
+    for entry in inputs:
+        if entry.startswith("@"):
+            with open(entry[1:], "r", encoding="utf-8") as f:
+                sources.extend(expand_inputs([line.strip() for line in f if line.strip() and not line.startswith("#")]))
+        elif entry.startswith(("http://", "https://")):
+            sources.append(entry)
+        elif os.path.isdir(entry):
+            for root, _, files in os.walk(entry):
+                for name in sorted(files):
+                    if name.lower().endswith(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS):
+                        sources.append(os.path.join(root, name))
+        elif os.path.isfile(entry):
+            sources.append(entry)
+        else:
+            print(f"⚠️ Skipping unknown input: {entry}")
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(sources))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-index videos into the VideoIQ library.")
+    parser.add_argument("inputs", nargs="+", help="files, directories, URLs or @list.txt")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes (each loads its own models)")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between sampled frames")
+    parser.add_argument("--whisper-model", default="base")
+    parser.add_argument("--whisper-workers", type=int, default=1, help="chunked transcription processes per worker")
+    parser.add_argument("--decode-workers", type=int, default=1, help="time shards decoded in parallel per video")
+    parser.add_argument("--speech-index", default="windows", choices=["windows", "segments"],
+                        help="embed overlapping transcript windows or raw Whisper segments")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8"],
+                        help="int8 = dynamically quantized CLIP/Whisper for CPU-only machines")
+    parser.add_argument("--force", action="store_true", help="re-index items that are already in the library")
+    parser.add_argument("--metrics-out", help="write Prometheus-format metrics here at the end "
+                                              "(per-span JSON lines go to $VIDEOIQ_METRICS_LOG)")
+    parser.add_argument("--backend", default="qdrant", choices=["qdrant", "numpy"], help="vector storage engine")
+    args = parser.parse_args(argv)
+
+    from ml_engine.store import VectorDB
+    from ml_engine.library import VideoLibrary, make_video_id
+    from ml_engine.cache import hash_file
+    from ml_engine.keyword_index import KeywordIndex
+    from ml_engine.metrics import METRICS
+
+    db = VectorDB(backend=args.backend)
+    library = VideoLibrary()
+    keyword_index = KeywordIndex()
+
+    items = {}
+    for source in expand_inputs(args.inputs):
+        is_url = source.startswith(("http://", "https://"))
+        # Same id as make_video_id, the full hash goes along so workers don't read the file again
+        content_hash = None if is_url else hash_file(source)
+        video_id = content_hash[:16] if content_hash else make_video_id(source)
+        # Entries the app registered for a run that never finished are indexed again
+        if not args.force and library.is_complete(video_id):
+            print(f"⏭️ Already indexed: {source}")
+            continue
+        if video_id in items:
+            # Identical files at two paths would otherwise be ingested twice, concurrently, under one id
+            print(f"⏭️ Same content as {items[video_id]['source']}: {source}")
+            continue
+        items[video_id] = {"source": source, "video_id": video_id, "is_url": is_url, "content_hash": content_hash}
+    items = list(items.values())
+
+    if not items:
+        print("Nothing to do.")
+        return 0
+
+    print(f"🚀 Ingesting {len(items)} items with {args.workers} workers...")
+    started = time.perf_counter()
+    done, failed = [], []
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.interval, args.whisper_model, args.whisper_workers, args.decode_workers,
+                                       args.speech_index, args.precision)) as pool:
+        futures = {pool.submit(_ingest_one, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                print(f"❌ {item['source']}: {e}")
+                failed.append(item["source"])
+                continue
+
+            METRICS.merge(report.pop("metrics"))
+            upload_started = time.perf_counter()
+            for method, call_args, call_kwargs in report.pop("db_calls"):
+                getattr(db, method)(*call_args, **call_kwargs)
+            keyword_index.add_video(report["video_id"], report.pop("transcript"))
+            report["upload_seconds"] = time.perf_counter() - upload_started
+            library.add(report["video_id"], report["source"], report["file_path"], is_audio=report["is_audio"])
+
+            done.append(report)
+            print(f"✅ {report['source']}: {report['seconds']:.1f}s "
+                  f"({report['segments']} segments, {report['frames']} frames, upload {report['upload_seconds']:.1f}s)")
+
+    wall = time.perf_counter() - started
+    total_segments = sum(r["segments"] for r in done)
+    total_frames = sum(r["frames"] for r in done)
+
+    print("\n--- Ingestion summary ---")
+    for r in done:
+        print(f"{r['seconds']:8.1f}s  {r['segments']:6d} seg  {r['frames']:6d} frames  {r['source']}")
+    print(f"Items: {len(done)} ok, {len(failed)} failed")
+    print(f"Wall time: {wall:.1f}s  |  {len(done) / wall * 3600:.1f} items/h  |  "
+          f"{total_segments / wall:.1f} segments/s  |  {total_frames / wall:.1f} frames/s")
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(METRICS.prometheus_text())
+        print(f"📊 Metrics written to {args.metrics_out}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
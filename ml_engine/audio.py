@@ -1,17 +1,192 @@
 import whisper
+import copy
 import warnings
+import os
+import multiprocessing
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from ml_engine.metrics import METRICS
+from ml_engine.quantize import PRECISIONS, quantize_linear_layers, check_tolerance
 
 warnings.filterwarnings("ignore")
 
+SAMPLE_RATE = 16000
+
+# --- Process pool workers (module level so they can be pickled) ---
+_worker_model = None
+
+def _init_worker(model_size, threads, precision):
+    global _worker_model
+    torch.set_num_threads(threads)
+    # The parent already checked the int8 model against fp32
+    _worker_model, _ = load_whisper(model_size, precision)
+
+def _probe_mel(n_mels=80):
+    """Log-mel of a few seconds of synthetic voiced sound, for the fp32/int8 comparison"""
+    t = np.arange(5 * SAMPLE_RATE) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6)) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    audio = whisper.pad_or_trim((0.2 * voice).astype(np.float32))
+    return whisper.log_mel_spectrogram(audio, n_mels).unsqueeze(0)
+
+def load_whisper(model_size, precision="fp32", tolerance=None):
+    """
+    Loads Whisper, optionally with int8 dynamic quantization (CPU only).
+    With a tolerance, the quantized encoder's output on a probe clip must stay
+    within it (1 - cosine similarity per frame) or the fp32 model is returned.
+    Returns (model, precision actually used).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+    if precision == "int8" and torch.cuda.is_available():
+        print("ℹ️ int8 inference is CPU-only, keeping fp32 on GPU.")
+        precision = "fp32"
+    model = whisper.load_model(model_size, device="cpu" if precision == "int8" else None)
+    if precision == "fp32":
+        return model, "fp32"
+
+    quantized = quantize_linear_layers(copy.deepcopy(model).eval())
+    if tolerance is not None:
+        # large-v3 takes 128 mel bins, earlier models 80
+        mel = _probe_mel(model.dims.n_mels)
+        with torch.no_grad():
+            reference, candidate = model.encoder(mel)[0], quantized.encoder(mel)[0]
+        if not check_tolerance("Whisper encoder", reference, candidate, tolerance):
+            print("⚠️ Keeping fp32 Whisper, int8 drifted past the tolerance.")
+            return model, "fp32"
+    return quantized, "int8"
+
+def _transcribe_chunk(job):
+    offset, samples = job
+    result = _worker_model.transcribe(samples, fp16=False)
+    return _shift_segments(result["segments"], offset)
+
+def _shift_segments(segments, offset):
+    """Moves chunk-local segment times onto the global timeline"""
+    return [{"start": s["start"] + offset, "end": s["end"] + offset, "text": s["text"]} for s in segments]
+
+def find_speech_chunks(samples, max_chunk=120.0, min_silence=2.0, silence_db=40.0, frame_ms=30, pad=0.2):
+    """
+    Splits 16 kHz audio into chunks of speech, cutting at low-energy points.
+    Silent stretches longer than min_silence seconds are dropped entirely,
+    shorter pauses stay inside a chunk so Whisper keeps its context.
+    A frame counts as silent when it is silence_db below the loudest frame,
+    so quietly recorded audio is split the same way as loud audio.
+    Returns a list of (start_sample, end_sample).
+    """
+    frame = int(SAMPLE_RATE * frame_ms / 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    # Per-frame loudness in dBFS, threshold relative to the recording's own level only
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    db = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+    voiced = db > db.max() - silence_db
+    if not voiced.any():
+        # Nothing stands out (e.g. pure digital silence): let Whisper see all of it
+        return [(0, len(samples))]
+
+    # Voiced runs, bridging gaps shorter than min_silence
+    max_gap = int(min_silence * 1000 / frame_ms)
+    regions = []
+    for idx in np.flatnonzero(voiced):
+        if regions and idx - regions[-1][1] <= max_gap:
+            regions[-1][1] = idx + 1
+        else:
+            regions.append([idx, idx + 1])
+
+    # One chunk per region, long ones split at their quietest frame near max_chunk
+    max_frames = int(max_chunk * 1000 / frame_ms)
+    # Only edges that border silence get padded; chunks meeting at a cut would overlap
+    # and transcribe the words around it twice
+    pad_frames = int(pad * 1000 / frame_ms)
+    chunks = []
+    for start, end in regions:
+        start_pad = pad_frames
+        while end - start > max_frames:
+            window = db[start + max_frames * 3 // 4:start + max_frames]
+            cut = start + max_frames * 3 // 4 + int(np.argmin(window))
+            chunks.append((start - start_pad, cut))
+            start, start_pad = cut, 0
+        chunks.append((start - start_pad, end + pad_frames))
+
+    return [(max(s, 0) * frame, min(e * frame, len(samples))) for s, e in chunks]
+
 class AudioTranscriber:
-    def __init__(self, model_size="base"):
+    def __init__(self, model_size="base", workers=1, precision="fp32", tolerance=0.05):
+        """
+        workers > 1 enables chunked mode: silence is skipped and speech chunks
+        are transcribed across a process pool, one Whisper copy per process.
+        precision="int8" quantizes the Linear layers for CPU inference (see load_whisper).
+        """
         print(f"Loading Whisper model ({model_size})...")
-        self.model = whisper.load_model(model_size)
+        self.model_size = model_size
+        self.workers = workers
+        self.model, self.precision = load_whisper(model_size, precision, tolerance)
+        self._pool = None
+
+    @property
+    def cache_tag(self):
+        """Identifies the transcription settings for cache keys"""
+        tag = self.model_size if self.workers <= 1 else f"{self.model_size}-chunked"
+        return tag if self.precision == "fp32" else f"{tag}-{self.precision}"
+
+    def _get_pool(self):
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # spawn: this process already holds Whisper (and torch threads), forking it can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_size, threads, self.precision)
+            )
+        return self._pool
+
+    def transcribe(self, audio):
+        """audio: path to a file, or a 16 kHz mono float32 array (VideoProcessor.decode_audio)"""
+        if isinstance(audio, np.ndarray):
+            print(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s of in-memory audio...")
+        else:
+            print(f"Transcribing {audio}...")
+        with METRICS.span("transcription", model=self.model_size, chunked=self.workers > 1, precision=self.precision):
+            if self.workers > 1:
+                segments = self.transcribe_chunked(audio)
+            else:
+                # fp16 only applies on GPU; int8 models must run in fp32 activations
+                segments = self.model.transcribe(audio, fp16=torch.cuda.is_available())["segments"] # Returns text with timestamps
+        METRICS.inc("segments_transcribed", len(segments))
+        return segments
+
+    def transcribe_chunked(self, audio):
+        """
+        Skips silent regions and transcribes speech chunks in parallel.
+        Segments are stitched back in time order with global timestamps.
+        """
+        samples = audio if isinstance(audio, np.ndarray) else whisper.load_audio(audio)
+        chunks = find_speech_chunks(samples)
+        skipped = 1 - sum(e - s for s, e in chunks) / max(len(samples), 1)
+        print(f"✂️ {len(chunks)} speech chunks, skipping {skipped:.0%} silence.")
+
+        jobs = [(s / SAMPLE_RATE, samples[s:e]) for s, e in chunks]
+        if len(jobs) <= 1:
+            # Not worth a round trip through the pool
+            segments = []
+            for offset, chunk in jobs:
+                segments.extend(_shift_segments(self.model.transcribe(chunk, fp16=False)["segments"], offset))
+        else:
+            segments = [seg for part in self._get_pool().map(_transcribe_chunk, jobs) for seg in part]
+
+        segments.sort(key=lambda s: s["start"])
+        for idx, seg in enumerate(segments):
+            seg["id"] = idx
+        return segments
 
-    def transcribe(self, audio_path):
-        print(f"Transcribing {audio_path}...")
-        result = self.model.transcribe(audio_path)
-        return result["segments"] # Returns text with timestamps
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 if __name__ == "__main__":
-    print("Audio module is ready.")
\ No newline at end of file
+    print("Audio module is ready.")
@@ -0,0 +1,467 @@
+# File: ml_engine/backends.py
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+import numpy as np
+from ml_engine.filelock import file_lock
+
+# Same fields the app reads from Qdrant's ScoredPoint
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+
+class QdrantBackend:
+    """Local-mode Qdrant (the original storage)"""
+    # Local mode isn't safe to query from several threads, VectorDB serializes all calls
+    concurrent_search = False
+
+    def __init__(self, path="./qdrant_db"):
+        from qdrant_client import QdrantClient
+        self.client = QdrantClient(path=path)
+
+    def _video_filter(self, video_ids):
+        from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny
+        if video_ids is None:
+            return None
+        if isinstance(video_ids, str):
+            match = MatchValue(value=video_ids)
+        else:
+            match = MatchAny(any=list(video_ids))
+        return Filter(must=[FieldCondition(key="video_id", match=match)])
+
+    def ensure_collection(self, name, size):
+        from qdrant_client.models import (VectorParams, Distance, PayloadSchemaType, Filter,
+                                          IsEmptyCondition, PayloadField)
+        if not self.client.collection_exists(name):
+            self.client.create_collection(
+                collection_name=name,
+                vectors_config=VectorParams(size=size, distance=Distance.COSINE)
+            )
+        # Every point is tagged with its video, index it for filtered search/delete.
+        # Idempotent, so collections created before the index existed get it too
+        self.client.create_payload_index(
+            collection_name=name,
+            field_name="video_id",
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+        # Points stored before they carried a video_id can't be filtered or deleted per video
+        untagged = self.client.count(
+            collection_name=name,
+            count_filter=Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="video_id"))]),
+            exact=False
+        ).count
+        if untagged:
+            print(f"⚠️ {untagged} points in '{name}' have no video_id and can't be filtered or deleted "
+                  f"per video: delete ./qdrant_db and re-index to clean them up")
+
+    def delete_collection(self, name):
+        self.client.delete_collection(name)
+
+    def upload(self, name, vectors, payloads, ids=None):
+        # Points with an existing id are overwritten (upsert)
+        self.client.upload_collection(collection_name=name, vectors=vectors, payload=payloads, ids=ids)
+
+    def delete_video(self, name, video_id):
+        from qdrant_client.models import FilterSelector
+        self.client.delete(
+            collection_name=name,
+            points_selector=FilterSelector(filter=self._video_filter(video_id))
+        )
+
+    def count(self, name, video_ids=None):
+        return self.client.count(collection_name=name, count_filter=self._video_filter(video_ids), exact=True).count
+
+    def search(self, name, query_vector, top_k, video_ids=None):
+        return self.client.search(
+            collection_name=name,
+            query_vector=query_vector,
+            query_filter=self._video_filter(video_ids),
+            limit=top_k
+        )
+
+class _MemmapCollection:
+    """
+    One collection on disk:
+      vectors.bin   normalized rows, float16 or int8 (append-only)
+      scales.bin    float32 per-row scale (int8 only)
+      full.bin      float32 rows for rescoring (optional)
+      alive.bin     uint8 tombstones, rewritten in place on delete
+      payloads.jsonl, meta.json
+    Several processes may share a collection: writes hold <folder>.lock and
+    first catch up on other processes' commits, readers pick them up through
+    refresh() (meta.json is replaced on every commit).
+    Searches widen vectors.bin to float32 BLOCK_ROWS at a time through one
+    reused scratch buffer, so RAM stays at the size of the compact rows;
+    narrow filters only widen the rows of the requested videos.
+    """
+    BLOCK_ROWS = 4096   # 8 MB of float32 scratch at 512 dims
+    SELECTIVE = 0.25   # filters matching less than this share of rows gather them instead of scanning
+
+    def __init__(self, folder, dim, dtype, keep_full):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self._scratch = None   # float32 block buffer for _score_all, allocated on first search
+        self.lock_path = folder.rstrip("/\\") + ".lock"
+        with file_lock(self.lock_path):
+            os.makedirs(folder, exist_ok=True)
+            if os.path.exists(self._path("meta.json")):
+                self.meta, self._meta_stamp = self._read_meta()
+            else:
+                # generation changes whenever row numbers do (creation, compaction)
+                self.meta = {"dim": dim, "dtype": dtype, "keep_full": keep_full, "count": 0, "videos": {},
+                             "generation": uuid.uuid4().hex}
+                self._save_meta()
+            self.dim = self.meta["dim"]
+            self.dtype = np.dtype(self.meta["dtype"])
+
+            # Under the lock: another process may be mid-append, its rows aren't orphans
+            self._truncate_files()
+            self._load_payloads()
+            self._remap()
+
+    def _read_meta(self):
+        path = self._path("meta.json")
+        # Stat first: a commit landing in between only causes one extra refresh
+        stamp = self._stamp(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), stamp
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        # meta.json is replaced, never rewritten in place, so the inode changes on every save
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _load_payloads(self):
+        """Reads the committed payload lines (a concurrent append may have written more)"""
+        self.payloads = []
+        self._payload_bytes = 0
+        path = self._path("payloads.jsonl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if len(self.payloads) == self.meta["count"]:
+                        break
+                    self.payloads.append(json.loads(line))
+                    self._payload_bytes += len(line)
+
+    def _truncate_files(self):
+        """
+        meta.json is written last on append, so rows past meta["count"] are
+        left over from an append that crashed halfway; cut every file back to
+        the committed rows so the files stay aligned.
+        """
+        n = self.meta["count"]
+        row_bytes = {"vectors.bin": self.dim * self.dtype.itemsize, "alive.bin": 1}
+        if self.dtype == np.int8:
+            row_bytes["scales.bin"] = 4
+        if self.meta["keep_full"]:
+            row_bytes["full.bin"] = self.dim * 4
+        for name, size in row_bytes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > n * size:
+                os.truncate(path, n * size)
+
+        path = self._path("payloads.jsonl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                lines = f.readlines()
+            if len(lines) > n:
+                os.truncate(path, sum(len(line) for line in lines[:n]))
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _save_meta(self):
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+        self._meta_stamp = self._stamp(self._path("meta.json"))
+
+    def _map(self, name, dtype, shape, mode="r"):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode=mode, shape=shape)
+
+    def _map_files(self):
+        n = self.meta["count"]
+        self.vectors = self._map("vectors.bin", self.dtype, (n, self.dim))
+        self.scales = self._map("scales.bin", np.float32, (n,)) if self.dtype == np.int8 else None
+        self.full = self._map("full.bin", np.float32, (n, self.dim)) if self.meta["keep_full"] else None
+        self.alive = self._map("alive.bin", np.uint8, (n,), mode="r+")
+
+    def _video_codes(self, payloads):
+        codes = self.meta["videos"]
+        return np.array([codes.get(p.get("video_id"), -1) for p in payloads], dtype=np.int32)
+
+    def _remap(self):
+        self._map_files()
+        # Row -> small int video code, for vectorized filtering
+        self.video_codes = self._video_codes(self.payloads)
+        # Point id -> live row, for upserts (later rows win)
+        self.id_to_row = {}
+        for row, p in enumerate(self.payloads):
+            if "point_id" in p and self.alive[row]:
+                self.id_to_row[p["point_id"]] = row
+
+    def _quantize(self, vectors):
+        if self.dtype == np.int8:
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    def append(self, vectors, payloads, ids=None):
+        """Appends rows; rows whose id already exists replace the old row (upsert)"""
+        vectors = np.array(vectors, dtype=np.float32).reshape(-1, self.dim)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        quantized, scales = self._quantize(vectors)
+        if ids is not None:
+            payloads = [dict(p, point_id=i) for p, i in zip(payloads, ids)]
+
+        with self.lock, file_lock(self.lock_path):
+            self._catch_up()
+            if ids is not None:
+                replaced = [self.id_to_row[i] for i in ids if i in self.id_to_row]
+                if replaced:
+                    self.alive[replaced] = 0
+                    self.alive.flush()
+            for p in payloads:
+                video_id = p.get("video_id")
+                if video_id is not None and video_id not in self.meta["videos"]:
+                    self.meta["videos"][video_id] = len(self.meta["videos"])
+
+            with open(self._path("vectors.bin"), "ab") as f:
+                f.write(quantized.tobytes())
+            if scales is not None:
+                with open(self._path("scales.bin"), "ab") as f:
+                    f.write(scales.tobytes())
+            if self.meta["keep_full"]:
+                with open(self._path("full.bin"), "ab") as f:
+                    f.write(vectors.tobytes())
+            with open(self._path("alive.bin"), "ab") as f:
+                f.write(np.ones(len(vectors), dtype=np.uint8).tobytes())
+            data = "".join(json.dumps(p) + "\n" for p in payloads).encode("utf-8")
+            with open(self._path("payloads.jsonl"), "ab") as f:
+                f.write(data)
+
+            self.meta["count"] += len(vectors)
+            self._save_meta()
+            self._payload_bytes += len(data)
+            self._index_appended(payloads)
+
+    def _index_appended(self, payloads):
+        """Only the new rows need indexing; remapping the files is cheap"""
+        first_row = len(self.payloads)
+        self.payloads.extend(payloads)
+        self._map_files()
+        self.video_codes = np.concatenate([self.video_codes, self._video_codes(payloads)])
+        for row, p in enumerate(payloads, first_row):
+            if "point_id" in p:
+                self.id_to_row[p["point_id"]] = row
+
+    def refresh(self):
+        """
+        Picks up what another process (the app, ingest.py) committed since this
+        one last looked: appended rows are read incrementally, a compaction or
+        reset means a full reload. Deletes need nothing, alive.bin is shared.
+        """
+        try:
+            if self._stamp(self._path("meta.json")) == self._meta_stamp:
+                return
+        except FileNotFoundError:
+            # Collection being deleted/recreated; keep serving the old rows
+            return
+        # The file lock keeps a compaction from swapping files while they're mapped
+        with self.lock, file_lock(self.lock_path):
+            self._catch_up()
+
+    def _catch_up(self):
+        """Caller holds both locks"""
+        try:
+            if self._stamp(self._path("meta.json")) == self._meta_stamp:
+                return
+            meta, stamp = self._read_meta()
+        except FileNotFoundError:
+            return
+        if meta.get("generation") != self.meta.get("generation") or meta["count"] < self.meta["count"]:
+            self.meta = meta
+            self._load_payloads()
+            self._remap()
+        elif meta["count"] > self.meta["count"]:
+            payloads = []
+            with open(self._path("payloads.jsonl"), "rb") as f:
+                f.seek(self._payload_bytes)
+                for _ in range(meta["count"] - self.meta["count"]):
+                    line = f.readline()
+                    payloads.append(json.loads(line))
+                    self._payload_bytes += len(line)
+            self.meta = meta
+            self._index_appended(payloads)
+        else:
+            self.meta = meta
+        self._meta_stamp = stamp
+
+    def _mask(self, video_ids):
+        mask = self.alive.astype(bool)
+        if video_ids is not None:
+            if isinstance(video_ids, str):
+                video_ids = [video_ids]
+            codes = [self.meta["videos"][v] for v in video_ids if v in self.meta["videos"]]
+            mask &= np.isin(self.video_codes, codes)
+        return mask
+
+    def delete_video(self, video_id):
+        with self.lock, file_lock(self.lock_path):
+            self._catch_up()
+            rows = self._mask(video_id)
+            if rows.any():
+                self.alive[rows] = 0
+                self.alive.flush()
+            if self.meta["count"] and (self.alive == 0).mean() > 0.5:
+                self._compact()
+
+    def _compact(self):
+        """Rewrites the files without tombstoned rows"""
+        keep = self.alive.astype(bool)
+        parts = [("vectors.bin", self.vectors)]
+        if self.scales is not None:
+            parts.append(("scales.bin", self.scales))
+        if self.full is not None:
+            parts.append(("full.bin", self.full))
+        for name, array in parts:
+            data = np.ascontiguousarray(array[keep])
+            with open(self._path(name + ".tmp"), "wb") as f:
+                f.write(data.tobytes())
+        payloads = [p for p, k in zip(self.payloads, keep) if k]
+        data = "".join(json.dumps(p) + "\n" for p in payloads).encode("utf-8")
+        with open(self._path("payloads.jsonl.tmp"), "wb") as f:
+            f.write(data)
+        with open(self._path("alive.bin.tmp"), "wb") as f:
+            f.write(np.ones(len(payloads), dtype=np.uint8).tobytes())
+
+        # Drop the maps before replacing the files underneath them
+        self.vectors = self.scales = self.full = self.alive = None
+        for name in [n for n, _ in parts] + ["payloads.jsonl", "alive.bin"]:
+            os.replace(self._path(name + ".tmp"), self._path(name))
+        self.payloads = payloads
+        self._payload_bytes = len(data)
+        self.meta["count"] = len(payloads)
+        self.meta["generation"] = uuid.uuid4().hex
+        self._save_meta()
+        self._remap()
+
+    def count(self, video_ids=None):
+        return int(self._mask(video_ids).sum())
+
+    def _widen(self, rows):
+        """float32 copy of the given rows (slice or index array), int8 scales applied"""
+        block = self.vectors[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def _score_all(self, query):
+        """Dot products of every row with query, widened block by block into a reused buffer"""
+        n = self.meta["count"]
+        if self._scratch is None:
+            self._scratch = np.empty((self.BLOCK_ROWS, self.dim), dtype=np.float32)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, n)
+            block = self._scratch[:end - start]
+            np.copyto(block, self.vectors[start:end], casting="unsafe")
+            np.dot(block, query, out=scores[start:end])
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(self, query_vector, top_k, video_ids=None, rescore=True, oversample=4):
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-12
+
+        with self.lock:
+            n = self.meta["count"]
+            if n == 0:
+                return []
+            mask = self._mask(video_ids)
+            live = np.flatnonzero(mask)
+            if len(live) == 0:
+                return []
+
+            if len(live) < n * self.SELECTIVE:
+                # Narrow filter (e.g. one video): score just its rows
+                rows = live
+                scores = self._widen(rows) @ query
+            else:
+                rows = None
+                scores = self._score_all(query)
+                scores[~mask] = -np.inf
+
+            use_full = rescore and self.full is not None
+            k = min(top_k * oversample if use_full else top_k, len(live))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            candidate_rows = candidates if rows is None else rows[candidates]
+
+            if use_full:
+                # Exact scores for the shortlist from the float32 copy
+                candidate_rows = np.sort(candidate_rows)
+                scores_exact = np.asarray(self.full[candidate_rows]) @ query
+                order = np.argsort(-scores_exact)[:top_k]
+                return [self._hit(candidate_rows[i], scores_exact[i]) for i in order]
+
+            order = np.argsort(-scores[candidates])[:top_k]
+            return [self._hit(candidate_rows[i], scores[candidates[i]]) for i in order]
+
+    def _hit(self, row, score):
+        payload = self.payloads[row]
+        return Hit(payload.get("point_id", int(row)), float(score), payload)
+
+class NumpyBackend:
+    """
+    In-process engine: normalized vectors stored as float16 or int8 in memory-mapped
+    files, brute-force top-k with vectorized dot products, optional rescoring of
+    the shortlist against float32 copies. No server, near-zero cold start.
+    """
+    # Each collection has its own lock, so searches on different collections run in parallel
+    concurrent_search = True
+
+    def __init__(self, path="./vector_db", dtype="float16", keep_full=True, rescore=True):
+        self.path = path
+        self.dtype = dtype
+        self.keep_full = keep_full
+        self.rescore = rescore
+        self.collections = {}
+
+    def _folder(self, name):
+        return os.path.join(self.path, name)
+
+    def ensure_collection(self, name, size):
+        if name not in self.collections:
+            self.collections[name] = _MemmapCollection(self._folder(name), size, self.dtype, self.keep_full)
+
+    def delete_collection(self, name):
+        collection = self.collections.pop(name, None)
+        if collection is not None:
+            collection.vectors = collection.scales = collection.full = collection.alive = None
+        folder = self._folder(name)
+        with file_lock(folder + ".lock"):
+            if os.path.isdir(folder):
+                for entry in os.listdir(folder):
+                    os.remove(os.path.join(folder, entry))
+                os.rmdir(folder)
+
+    def upload(self, name, vectors, payloads, ids=None):
+        self.collections[name].append(vectors, payloads, ids=ids)
+
+    def delete_video(self, name, video_id):
+        self.collections[name].delete_video(video_id)
+
+    def count(self, name, video_ids=None):
+        self.collections[name].refresh()
+        return self.collections[name].count(video_ids)
+
+    def search(self, name, query_vector, top_k, video_ids=None):
+        self.collections[name].refresh()
+        return self.collections[name].search(query_vector, top_k, video_ids=video_ids, rescore=self.rescore)
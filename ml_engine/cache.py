@@ -0,0 +1,136 @@
+# File: ml_engine/cache.py
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+
+def hash_file(path):
+    """sha1 of a file's contents, read in 1 MB blocks"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def save_stream(stream, dest_path):
+    """
+    Copies a file-like object (e.g. a Streamlit upload) to disk and hashes it in the same pass.
+    Returns the sha1 hex digest of the written bytes.
+    """
+    digest = hashlib.sha1()
+    with open(dest_path, "wb") as f:
+        for block in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+class FeatureCache:
+    """
+    Content-addressed on-disk cache for expensive ingestion results
+    (Whisper segments, embedding arrays). Entries are keyed by the media hash
+    plus model and sampling parameters, and evicted least-recently-used once
+    the folder grows past max_bytes. Safe to share between threads (the
+    ingestion branches and the summarizer write concurrently).
+    """
+    def __init__(self, cache_folder="./cache", max_bytes=5 * 1024**3):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        self._lock = threading.Lock()
+        self.total_bytes = sum(os.path.getsize(p) for p in self._entries())
+
+    def _entries(self):
+        for name in os.listdir(self.cache_folder):
+            if name.endswith((".json", ".npz")):
+                yield os.path.join(self.cache_folder, name)
+
+    def key(self, content_hash, kind, **params):
+        """Builds a cache key, e.g. key(h, "transcript", model="base")"""
+        parts = [content_hash, kind] + [f"{k}={params[k]}" for k in sorted(params)]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_folder, f"{key}{ext}")
+
+    def _touch(self, path):
+        # mtime doubles as the LRU clock
+        os.utime(path, None)
+
+    def _write(self, path, write_fn):
+        # Per-process + thread temp name (ingest workers share the folder), the slow serialization runs outside the lock
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_fn(tmp_path)
+        with self._lock:
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.total_bytes += os.path.getsize(path)
+            self._evict()
+
+    def _evict(self):
+        """Caller holds self._lock"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        for _, path in sorted(entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                # Removed by someone else (another process sharing the folder)
+                continue
+            self.total_bytes -= size
+
+    def get_json(self, key):
+        path = self._path(key, ".json")
+        try:
+            self._touch(path)
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Missing, or evicted by a concurrent write
+            return None
+
+    def put_json(self, key, value):
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+        self._write(self._path(key, ".json"), write)
+
+    def get_arrays(self, key):
+        """Returns a dict of arrays, float16 embeddings are widened back to float32"""
+        path = self._path(key, ".npz")
+        try:
+            self._touch(path)
+            with np.load(path) as data:
+                return {
+                    name: data[name].astype(np.float32) if data[name].dtype == np.float16 else data[name]
+                    for name in data.files
+                }
+        except FileNotFoundError:
+            return None
+
+    def put_arrays(self, key, half_precision=("vectors",), **arrays):
+        """
+        Arrays named in half_precision (embeddings) are stored as float16, which
+        halves their size; timestamps and everything else keep their dtype.
+        """
+        compact = {
+            name: np.asarray(a, dtype=np.float16) if name in half_precision else np.asarray(a)
+            for name, a in arrays.items()
+        }
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **compact)
+        self._write(self._path(key, ".npz"), write)
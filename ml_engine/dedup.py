@@ -0,0 +1,69 @@
+# File: ml_engine/dedup.py
+import cv2
+import numpy as np
+
+class FrameDeduplicator:
+    """
+    Drops near-duplicate frames before they reach CLIP.
+    A frame is kept when it differs from the last kept frame either by
+    perceptual hash (structure) or by colour histogram (scene cut).
+    """
+    def __init__(self, hash_threshold=6, hist_threshold=0.92, thumb_size=(64, 36)):
+        self.hash_threshold = hash_threshold
+        self.hist_threshold = hist_threshold
+        self.thumb_size = thumb_size
+        self.seen = 0
+        self.kept = 0
+
+    def _dhash(self, gray):
+        """64-bit difference hash of a grayscale frame."""
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return int(np.packbits(bits).view(">u8")[0])
+
+    def _histogram(self, small_bgr):
+        hsv = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+        return cv2.normalize(hist, hist).flatten()
+
+    def _signature(self, frame):
+        small = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return self._dhash(gray), self._histogram(small)
+
+    def is_new_scene(self, signature, reference):
+        if reference is None:
+            return True
+        frame_hash, hist = signature
+        ref_hash, ref_hist = reference
+        if bin(frame_hash ^ ref_hash).count("1") > self.hash_threshold:
+            return True
+        return cv2.compareHist(hist, ref_hist, cv2.HISTCMP_CORREL) < self.hist_threshold
+
+    def filter(self, frame_stream, interval=0.0, end_time=None):
+        """
+        frame_stream: iterable of (timestamp, frame) sampled every `interval` seconds
+        Yields ((start, end), frame) for every kept frame, where [start, end)
+        is the time span the frame stands in for. A kept frame is emitted once
+        the next scene starts (or the stream ends) so its span is final.
+        The last span runs to end_time (a time shard's edge) if given, else one
+        interval past the last sample, so consecutive streams leave no gap.
+        """
+        pending = None
+        reference = None
+        last_timestamp = 0.0
+
+        for timestamp, frame in frame_stream:
+            self.seen += 1
+            last_timestamp = timestamp
+            signature = self._signature(frame)
+
+            if self.is_new_scene(signature, reference):
+                if pending is not None:
+                    yield (pending[0], timestamp), pending[1]
+                pending = (timestamp, frame)
+                reference = signature
+                self.kept += 1
+
+        if pending is not None:
+            yield (pending[0], end_time if end_time is not None else last_timestamp + interval), pending[1]
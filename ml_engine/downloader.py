@@ -1,6 +1,7 @@
 import yt_dlp
 import os
 import uuid
+from ml_engine.metrics import METRICS
 
 class VideoDownloader:
     def __init__(self, download_folder="temp_data"):
@@ -28,7 +29,7 @@ class VideoDownloader:
         }
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with METRICS.span("download"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=True)
                 filename = ydl.prepare_filename(info)
                 
@@ -39,5 +40,6 @@ class VideoDownloader:
                 
                 return filename, is_audio
         except Exception as e:
+            METRICS.inc("download_failures")
             print(f" Download failed: {e}")
             return None, False
\ No newline at end of file
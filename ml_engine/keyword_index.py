@@ -0,0 +1,350 @@
+# File: ml_engine/keyword_index.py
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import uuid
+from ml_engine.filelock import file_lock
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+def parse_query(query):
+    """Splits a query into "quoted phrases" and loose terms"""
+    phrases = [tokenize(p) for p in re.findall(r'"([^"]+)"', query)]
+    loose = tokenize(re.sub(r'"[^"]*"', " ", query))
+    return [p for p in phrases if p], loose
+
+# Never drive candidate generation (see KeywordIndex.search); still scored when present
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our
+she so that the their them then there these they this to was we were what when where which who will with
+you your i'm it's that's don't we're you're
+""".split())
+
+class KeywordIndex:
+    """
+    Persisted inverted index over transcript segments of the whole library.
+    Postings keep token positions so quoted phrases can be matched exactly;
+    ranking is BM25.
+    Stored as a pickled snapshot plus an append-only log of add/remove
+    operations, so indexing a video only writes that video; the log is folded
+    into the snapshot once it grows past half the snapshot's size.
+    Processes sharing the files (app, ingest.py) write under a file lock and
+    first replay whatever the others logged, searches catch up the same way.
+    Every snapshot gets a new generation and its own log file, so a reader
+    that still holds an older snapshot never replays records meant for a newer one.
+    """
+    COMMON_DF = 0.05   # terms in more than this share of docs only score, they don't generate candidates
+
+    def __init__(self, path="./library/keyword_index.pkl", k1=1.5, b=0.75):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def log_path(self):
+        # Indexes saved before generations existed keep using the plain name
+        return f"{self.path}.{self.generation}.log" if self.generation else self.path + ".log"
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _load(self):
+        self.docs = []          # doc id -> {"video_id", "id", "start", "end", "text"} or None once removed
+        self.doc_len = []
+        self.postings = {}      # term -> {doc id: [positions]}
+        self.video_docs = {}    # video id -> [doc ids]
+        self.total_len = 0
+        self.live_docs = 0
+        self.generation = None
+        # The snapshot is replaced on save, so its inode tells whether someone compacted since
+        self._snapshot_stamp = self._stamp(self.path)
+        if self._snapshot_stamp is not None:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self.docs, self.doc_len, self.postings, self.video_docs, self.total_len, self.live_docs = state[:6]
+            self.generation = state[6] if len(state) > 6 else None
+        self._log_offset = 0
+        self._replay()
+
+    def _replay(self):
+        """Applies log records past the ones already applied (from any process)"""
+        try:
+            if os.path.getsize(self.log_path) <= self._log_offset:
+                return
+        except FileNotFoundError:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            while True:
+                try:
+                    op, video_id, segments = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError):
+                    # Torn record (crash, or a writer still appending); everything before it is intact
+                    break
+                self._remove(video_id)
+                if op == "add":
+                    self._add(video_id, segments)
+                self._log_offset = f.tell()
+
+    def _sync(self):
+        """Catches up with what other processes saved"""
+        if self._stamp(self.path) != self._snapshot_stamp:
+            self._load()
+        else:
+            self._replay()
+
+    def save(self):
+        """Writes a full snapshot and clears the log"""
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            self._save()
+
+    def _compact_doc_ids(self):
+        """Drops the slots removed videos left behind, renumbering the live docs"""
+        if len(self.docs) == self.live_docs:
+            return
+        live = [doc_id for doc_id, doc in enumerate(self.docs) if doc is not None]
+        new_ids = {old: new for new, old in enumerate(live)}
+        self.docs = [self.docs[old] for old in live]
+        self.doc_len = [self.doc_len[old] for old in live]
+        self.postings = {term: {new_ids[d]: positions for d, positions in posting.items()}
+                         for term, posting in self.postings.items()}
+        self.video_docs = {video_id: [new_ids[d] for d in doc_ids] for video_id, doc_ids in self.video_docs.items()}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._compact_doc_ids()
+        old_log = self.log_path
+        self.generation = uuid.uuid4().hex
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.docs, self.doc_len, self.postings, self.video_docs, self.total_len, self.live_docs,
+                         self.generation), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._snapshot_stamp = self._stamp(self.path)
+        if os.path.exists(old_log):
+            os.remove(old_log)
+        self._log_offset = 0
+
+    def _log(self, op, video_id, segments=None):
+        """Caller holds the file lock and has just synced"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.log_path, "ab") as f:
+            # Anything past the last good record is a torn append, records after it would never replay
+            f.truncate(self._log_offset)
+            pickle.dump((op, video_id, segments), f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._log_offset = f.tell()
+        snapshot_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self._log_offset > max(snapshot_size // 2, 1 << 20):
+            self._save()
+
+    def _remove(self, video_id):
+        for doc_id in self.video_docs.pop(video_id, []):
+            for term in set(tokenize(self.docs[doc_id]["text"])):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_len -= self.doc_len[doc_id]
+            self.live_docs -= 1
+            self.docs[doc_id] = None
+
+    def _add(self, video_id, segments):
+        doc_ids = []
+        for seg in segments:
+            doc_id = len(self.docs)
+            tokens = tokenize(seg["text"])
+            self.docs.append({"video_id": video_id, "id": seg.get("id"), "start": seg["start"],
+                              "end": seg.get("end", seg["start"]), "text": seg["text"]})
+            self.doc_len.append(len(tokens))
+            for pos, term in enumerate(tokens):
+                self.postings.setdefault(term, {}).setdefault(doc_id, []).append(pos)
+            self.total_len += len(tokens)
+            self.live_docs += 1
+            doc_ids.append(doc_id)
+        self.video_docs[video_id] = doc_ids
+
+    def remove_video(self, video_id):
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            self._remove(video_id)
+            self._log("remove", video_id)
+
+    def add_video(self, video_id, segments):
+        """Indexes a video's transcript segments, replacing any previous version"""
+        segments = [{"id": s.get("id"), "start": s["start"], "end": s.get("end", s["start"]), "text": s["text"]}
+                    for s in segments]
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            self._remove(video_id)
+            self._add(video_id, segments)
+            self._log("add", video_id, segments)
+
+    def _has_phrase(self, doc_id, phrase):
+        starts = self.postings[phrase[0]][doc_id]
+        for offset, term in enumerate(phrase[1:], 1):
+            positions = set(self.postings[term][doc_id])
+            starts = [p for p in starts if p + offset in positions]
+            if not starts:
+                return False
+        return True
+
+    def _docs_with_all(self, terms, scope):
+        """Docs (within scope, if given) containing every term; walks only the smallest list"""
+        lists = sorted((self.postings[t] for t in set(terms)), key=len)
+        if scope is not None and len(scope) < len(lists[0]):
+            return {d for d in scope if all(d in p for p in lists)}
+        return {d for d in lists[0] if all(d in p for p in lists[1:]) and (scope is None or d in scope)}
+
+    def _docs_with_any(self, terms, scope):
+        candidates = set()
+        for term in terms:
+            posting = self.postings[term]
+            if scope is not None and len(scope) < len(posting):
+                candidates.update(d for d in scope if d in posting)
+            else:
+                candidates.update(d for d in posting if scope is None or d in scope)
+        return candidates
+
+    def search(self, query, top_k=10, video_ids=None):
+        """
+        BM25 search. Quoted phrases must appear verbatim, loose terms are OR-ed.
+        video_ids: None = whole library, str or list to scope.
+        Returns: list of (score, doc dict) best first.
+
+        Loose queries use MaxScore-style pruning: rare terms generate the
+        candidates and common ones (stopwords, very frequent words) are only
+        looked up for those candidates. Common terms are promoted one by one
+        while docs holding only the rest could still reach the top k, so the
+        ranking stays exact.
+        """
+        phrases, loose = parse_query(query)
+        if isinstance(video_ids, str):
+            video_ids = {video_ids}
+        elif video_ids is not None:
+            video_ids = set(video_ids)
+
+        with self._lock:
+            self._sync()
+            if not self.live_docs:
+                return []
+            if any(t not in self.postings for p in phrases for t in p):
+                return []
+            terms = [t for t in dict.fromkeys(loose + [t for p in phrases for t in p]) if t in self.postings]
+            if not terms:
+                return []
+
+            scope = None
+            if video_ids is not None:
+                scope = {d for v in video_ids for d in self.video_docs.get(v, [])}
+
+            avg_len = self.total_len / self.live_docs
+            idf = {t: math.log(1 + (self.live_docs - len(self.postings[t]) + 0.5) / (len(self.postings[t]) + 0.5))
+                   for t in terms}
+
+            def score(doc_id):
+                total = 0.0
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                for term in terms:
+                    positions = self.postings[term].get(doc_id)
+                    if positions:
+                        tf = len(positions)
+                        total += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                return total
+
+            def rank(candidates):
+                return heapq.nlargest(top_k, ((score(d), d) for d in candidates))
+
+            if phrases:
+                # Docs containing every word of every phrase (and the words in order)
+                candidates = self._docs_with_all([t for p in phrases for t in p], scope)
+                best = rank(d for d in candidates if all(self._has_phrase(d, p) for p in phrases))
+            else:
+                common_df = self.COMMON_DF * self.live_docs
+                rare = [t for t in terms if t not in STOPWORDS and len(self.postings[t]) <= common_df]
+                common = [t for t in terms if t not in rare]
+                if not rare:
+                    # Only common words: let the least common one generate candidates
+                    rare = [min(common, key=lambda t: len(self.postings[t]))]
+                    common.remove(rare[0])
+                candidates = self._docs_with_any(rare, scope)
+                best = rank(candidates)
+
+                # A doc matching only common terms scores at most the sum of their upper bounds;
+                # while that could still beat the k-th score, the highest-bound (= rarest) common
+                # term also generates candidates
+                common.sort(key=lambda t: idf[t])
+                while common and (len(best) < top_k or sum(idf[t] * (self.k1 + 1) for t in common) > best[-1][0]):
+                    candidates |= self._docs_with_any([common.pop()], scope)
+                    best = rank(candidates)
+
+            return [(s, self.docs[doc_id]) for s, doc_id in best]
+
+def reciprocal_rank_fusion(ranked_lists, k=60, top_k=10):
+    """
+    Fuses several ranked lists of segment dicts (keys: video_id, start) into one.
+    Each item scores sum(1 / (k + rank)) over the lists it appears in.
+    Returns: list of (fused score, item) best first.
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked):
+            key = (item.get("video_id"), round(item["start"], 2))
+            score, first = fused.get(key, (0.0, item))
+            fused[key] = (score + 1.0 / (k + rank + 1), first)
+    return sorted(fused.values(), key=lambda pair: pair[0], reverse=True)[:top_k]
+
+def map_segments_to_windows(segment_hits, windows):
+    """
+    Replaces BM25 segment hits with the speech window (from the vector hits,
+    best first) that holds them, via the window's segment_ids or, for docs
+    indexed without ids, by time. Keeps the first rank of each window;
+    segments no window covers stay as they are.
+    """
+    mapped, seen = [], set()
+    for seg in segment_hits:
+        item = seg
+        for window in windows:
+            if window.get("video_id") != seg.get("video_id"):
+                continue
+            if seg.get("id") is not None and "segment_ids" in window:
+                inside = seg["id"] in window["segment_ids"]
+            else:
+                inside = window["start"] <= seg["start"] and seg.get("end", seg["start"]) <= window.get("end", window["start"])
+            if inside:
+                item = window
+                break
+        key = (item.get("video_id"), round(item["start"], 2))
+        if key not in seen:
+            seen.add(key)
+            mapped.append(item)
+    return mapped
+
+def drop_overlapping(items, top_k=10):
+    """Keeps the best of any items (video_id, start, end) whose time ranges overlap"""
+    kept = []
+    for item in items:
+        end = item.get("end", item["start"])
+        if not any(k.get("video_id") == item.get("video_id") and item["start"] < k.get("end", k["start"]) and k["start"] < end
+                   for k in kept):
+            kept.append(item)
+            if len(kept) == top_k:
+                break
+    return kept
@@ -0,0 +1,99 @@
+# File: ml_engine/library.py
+import hashlib
+import json
+import os
+import time
+from ml_engine.cache import hash_file
+from ml_engine.filelock import file_lock
+
+def make_video_id(source):
+    """
+    Stable id for a video: hash of the file contents for local files,
+    hash of the URL otherwise. Re-ingesting the same source gives the same id.
+    """
+    if os.path.isfile(source):
+        return hash_file(source)[:16]
+    return hashlib.sha1(source.strip().encode("utf-8")).hexdigest()[:16]
+
+class VideoLibrary:
+    """
+    Small JSON registry of every ingested video (id -> source, local path, title).
+    The vectors live in VectorDB, this is what maps a hit back to a playable file.
+    Several processes (app, ingest.py, search service) may share the file:
+    reads pick up other processes' changes, writes re-read under a file lock
+    so nobody's entries get lost.
+    """
+    def __init__(self, path="./library/videos.json"):
+        self.path = path
+        self.videos = {}
+        self._stamp = None
+        self.refresh()
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # The file is replaced on every save, so the inode changes too
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def refresh(self):
+        """Re-reads the registry if the file changed since it was last read or written"""
+        stamp = self._current_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.videos = json.load(f)
+        self._stamp = stamp
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.videos, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._stamp = self._current_stamp()
+
+    def add(self, video_id, source, file_path, is_audio=False, title=None, complete=True):
+        """complete=False registers a video whose ingestion is still running (see mark_complete)"""
+        with file_lock(self.path + ".lock"):
+            self.refresh()
+            self.videos[video_id] = {
+                "source": source,
+                "path": file_path,
+                "is_audio": is_audio,
+                "title": title or os.path.basename(file_path),
+                "added_at": time.time(),
+                "complete": complete
+            }
+            self._save()
+
+    def mark_complete(self, video_id):
+        with file_lock(self.path + ".lock"):
+            self.refresh()
+            if video_id in self.videos:
+                self.videos[video_id]["complete"] = True
+                self._save()
+
+    def is_complete(self, video_id):
+        """True once the video is fully indexed (entries from before the flag count as complete)"""
+        video = self.get(video_id)
+        return video is not None and video.get("complete", True)
+
+    def remove(self, video_id):
+        with file_lock(self.path + ".lock"):
+            self.refresh()
+            if self.videos.pop(video_id, None) is not None:
+                self._save()
+
+    def get(self, video_id):
+        self.refresh()
+        return self.videos.get(video_id)
+
+    def __contains__(self, video_id):
+        self.refresh()
+        return video_id in self.videos
+
+    def __len__(self):
+        self.refresh()
+        return len(self.videos)
@@ -0,0 +1,80 @@
+# File: ml_engine/manifest.py
+import json
+import os
+import threading
+
+class JobManifest:
+    """
+    Per-video checkpoint file, so an interrupted ingestion resumes where it stopped.
+    Records finished stages plus how far the incremental stages got
+    (segments_done for speech, frames_until = media time reached for frames).
+    The transcript is kept in a side file so checkpoints stay tiny.
+    """
+    def __init__(self, video_id, folder="./library/jobs"):
+        self.video_id = video_id
+        self.path = os.path.join(folder, f"{video_id}.json")
+        self.transcript_path = os.path.join(folder, f"{video_id}.transcript.json")
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"video_id": video_id, "stages": [], "complete": False}
+
+    def _write(self, path, value):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+    def _save(self):
+        self._write(self.path, self.state)
+
+    @property
+    def started(self):
+        return bool(self.state["stages"]) or "segments_done" in self.state or "frames_until" in self.state
+
+    @property
+    def complete(self):
+        return self.state["complete"]
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+            self._save()
+
+    def stage_done(self, stage):
+        return stage in self.state["stages"]
+
+    def mark_done(self, stage):
+        with self._lock:
+            if stage not in self.state["stages"]:
+                self.state["stages"].append(stage)
+            self._save()
+
+    def finish(self):
+        with self._lock:
+            self.state["complete"] = True
+            self._save()
+
+    def reset(self):
+        """Starts a fresh run; the download entry is kept since the file is still valid"""
+        with self._lock:
+            keep = {k: self.state[k] for k in ("file_path", "is_audio", "content_hash") if k in self.state}
+            self.state = {"video_id": self.video_id, "stages": [], "complete": False, **keep}
+            self._save()
+        if os.path.exists(self.transcript_path):
+            os.remove(self.transcript_path)
+
+    def save_transcript(self, segments):
+        self._write(self.transcript_path, segments)
+
+    def load_transcript(self):
+        if not os.path.exists(self.transcript_path):
+            return None
+        with open(self.transcript_path, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,108 @@
+# File: ml_engine/metrics.py
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("videoiq.metrics")
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+class Metrics:
+    """
+    Process-wide counters and timing spans for the pipeline.
+    Every finished span is also written as one JSON line to VIDEOIQ_METRICS_LOG
+    (if set) and to the "videoiq.metrics" logger at DEBUG level.
+    """
+    def __init__(self, log_path=None):
+        self.log_path = log_path or os.environ.get("VIDEOIQ_METRICS_LOG")
+        self._lock = threading.Lock()
+        self.counters = {}   # (name, labels) -> value
+        self.timings = {}    # (name, labels) -> [count, total seconds, max seconds]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            stats = self.timings.setdefault(key, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Times the block: with METRICS.span("transcription"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(name, seconds, **labels)
+            self._log({"ts": time.time(), "span": name, "seconds": round(seconds, 6), **labels})
+
+    def _log(self, record):
+        line = json.dumps(record, default=str)
+        logger.debug(line)
+        if self.log_path:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def snapshot(self):
+        """Plain-data copy, e.g. to ship from a worker process to the parent"""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "timings": [[name, list(labels), list(stats)] for (name, labels), stats in self.timings.items()],
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(l) for l in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, (count, total, longest) in snapshot["timings"]:
+                stats = self.timings.setdefault((name, tuple(tuple(l) for l in labels)), [0, 0.0, 0.0])
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def prometheus_text(self, prefix="videoiq"):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{prefix}_{name}_total{_format_labels(labels)} {value}")
+            for name in sorted({n for n, _ in self.timings}):
+                series = [(labels, stats) for (n, labels), stats in sorted(self.timings.items()) if n == name]
+                lines.append(f"# TYPE {prefix}_{name}_seconds summary")
+                for labels, (count, total, _) in series:
+                    lines.append(f"{prefix}_{name}_seconds_count{_format_labels(labels)} {count}")
+                    lines.append(f"{prefix}_{name}_seconds_sum{_format_labels(labels)} {total:.6f}")
+                # A summary only carries _count/_sum/quantiles, the max is its own family
+                lines.append(f"# TYPE {prefix}_{name}_seconds_max gauge")
+                for labels, (_, _, longest) in series:
+                    lines.append(f"{prefix}_{name}_seconds_max{_format_labels(labels)} {longest:.6f}")
+        return "\n".join(lines) + "\n"
+
+# Shared registry used by every ml_engine module
+METRICS = Metrics()
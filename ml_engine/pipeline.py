@@ -0,0 +1,385 @@
+# File: ml_engine/pipeline.py
+import os
+import queue
+import threading
+import numpy as np
+from ml_engine.dedup import FrameDeduplicator
+from ml_engine.metrics import METRICS
+from ml_engine.transcript import build_transcript_windows, approx_token_count
+
+_DONE = object()
+
+class IngestionPipeline:
+    """
+    Runs one video through transcription + embedding and into VectorDB.
+    The audio branch (ffmpeg -> Whisper -> text embeddings) and the visual branch
+    (decode -> dedup -> CLIP) run on their own threads, with a bounded queue
+    between frame decoding and image embedding. Usable outside Streamlit.
+    Vectors are upserted every batch, so a video is searchable while it is
+    still being ingested. With a PreviewStore, a thumbnail of every kept frame
+    is written on the way.
+    """
+    def __init__(self, processor, audio, vision, db, cache=None, keyword_index=None,
+                 frame_interval=1, batch_size=32, text_batch_size=128, queue_size=4, in_memory_audio=True,
+                 decode_workers=1, previews=None, speech_index="windows", library=None):
+        self.processor = processor
+        self.audio = audio
+        self.vision = vision
+        self.db = db
+        self.cache = cache
+        self.keyword_index = keyword_index
+        self.frame_interval = frame_interval
+        self.batch_size = batch_size
+        self.text_batch_size = text_batch_size
+        self.queue_size = queue_size
+        self.in_memory_audio = in_memory_audio
+        # > 1: split long videos into time ranges decoded + embedded by separate processes
+        self.decode_workers = decode_workers
+        self.previews = previews
+        # "windows": overlapping merged-segment windows (one CLIP context each), "segments": one vector per Whisper segment
+        if speech_index not in ("windows", "segments"):
+            raise ValueError(f"Unknown speech_index: {speech_index}")
+        self.speech_index = speech_index
+        # Optional VideoLibrary; an entry registered with complete=False is marked done at the end of run()
+        self.library = library
+
+    def _key(self, content_hash, kind, **params):
+        """Cache key, or None when caching is off / the media hash is unknown"""
+        return self.cache.key(content_hash, kind, **params) if self.cache and content_hash else None
+
+    def _load(self, key, arrays=False):
+        if key is None:
+            return None
+        value = self.cache.get_arrays(key) if arrays else self.cache.get_json(key)
+        METRICS.inc("cache_hits" if value is not None else "cache_misses")
+        return value
+
+    # --- AUDIO BRANCH ---
+    def _transcribe(self, file_path):
+        """Decodes audio over a pipe, falling back to a per-job WAV file"""
+        if self.in_memory_audio:
+            samples = self.processor.decode_audio(file_path)
+            if samples is not None:
+                return self.audio.transcribe(samples)
+
+        clean_audio = self.processor.extract_audio(file_path)
+        if not clean_audio:
+            return []
+        try:
+            return self.audio.transcribe(clean_audio)
+        finally:
+            os.remove(clean_audio)
+
+    def _speech_payloads(self, transcript):
+        """What goes into audio_search: one payload per embedded text"""
+        if self.speech_index == "segments":
+            return [{"timestamp": s['start'], "end": s['end'], "text": s['text'], "type": "speech"} for s in transcript]
+        count_tokens = getattr(self.vision, "count_tokens", approx_token_count)
+        return [{"timestamp": w['start'], "end": w['end'], "text": w['text'], "type": "speech_window",
+                 "segment_ids": w['segment_ids']}
+                for w in build_transcript_windows(transcript, count_tokens=count_tokens)]
+
+    def _run_audio(self, file_path, video_id, content_hash, report, result, manifest):
+        report("audio", 0.0, "Transcribing audio track...")
+        transcript_key = self._key(content_hash, "transcript", model=self.audio.cache_tag)
+        transcript = manifest.load_transcript() if manifest else None
+        if transcript is None:
+            transcript = self._load(transcript_key)
+        if transcript is None:
+            transcript = self._transcribe(file_path)
+            transcript = [{"id": s['id'], "start": s['start'], "end": s['end'], "text": s['text']} for s in transcript]
+            if transcript and transcript_key:
+                self.cache.put_json(transcript_key, transcript)
+        if manifest and not manifest.stage_done("transcribe"):
+            manifest.save_transcript(transcript)
+            manifest.mark_done("transcribe")
+        result["transcript"] = transcript
+        if self.keyword_index is not None:
+            self.keyword_index.add_video(video_id, transcript)
+        report("audio", 0.6, "Processing speech intelligence...")
+
+        if not transcript:
+            report("audio", 1.0, "No speech found.")
+            return
+        audio_payloads = self._speech_payloads(transcript)
+        if manifest and manifest.stage_done("audio"):
+            result["segments"] = len(audio_payloads)
+            report("audio", 1.0, None)
+            return
+
+        text_key = self._key(content_hash, "text_embeddings", whisper=self.audio.cache_tag, clip=self.vision.cache_tag,
+                             index=self.speech_index)
+        cached = self._load(text_key, arrays=True)
+
+        # Embed and upsert batch by batch so speech becomes searchable as it goes
+        embedded = []
+        total = len(audio_payloads)
+        resume_at = manifest.get("segments_done", 0) if manifest else 0
+        for start in range(resume_at, total, self.text_batch_size):
+            end = min(start + self.text_batch_size, total)
+            if cached is not None:
+                vecs = cached["vectors"][start:end]
+            else:
+                vecs = self.vision.get_text_embeddings([p['text'] for p in audio_payloads[start:end]], batch_size=self.text_batch_size)
+                if text_key:
+                    embedded.append(vecs)
+            self.db.upload_vectors(vecs, audio_payloads[start:end], "audio_search", video_id=video_id)
+            if manifest:
+                manifest.update(segments_done=end)
+            result["segments"] = end
+            report("audio", 0.6 + 0.4 * end / total, None)
+
+        # A resumed run only embedded the tail, don't cache a partial array
+        if embedded and resume_at == 0:
+            self.cache.put_arrays(text_key, vectors=np.concatenate(embedded))
+        if manifest:
+            manifest.mark_done("audio")
+        report("audio", 1.0, None)
+
+    # --- VISUAL BRANCH ---
+    def _decode_frames(self, file_path, video_id, dedup, frame_queue, stop, start_time):
+        """Producer: decodes + dedups frames and hands them over in embedding-sized batches"""
+        try:
+            spans, frames = [], []
+            frame_stream = self.processor.iter_keyframes(file_path, interval=self.frame_interval, start_time=start_time)
+            for span, frame in dedup.filter(frame_stream, interval=self.frame_interval):
+                if stop.is_set():
+                    return
+                if self.previews:
+                    # Thumbnails are keyed like the frame payloads: by span start
+                    self.previews.put_thumbnail(video_id, span[0], frame)
+                spans.append(span)
+                frames.append(frame)
+                if len(frames) == self.batch_size:
+                    # Blocks when the embedder falls behind, keeps memory bounded
+                    frame_queue.put((spans, frames))
+                    spans, frames = [], []
+            if frames:
+                frame_queue.put((spans, frames))
+        except Exception as e:
+            # Handed to the consumer so the visual branch fails instead of finishing short
+            frame_queue.put(e)
+        finally:
+            frame_queue.put(_DONE)
+
+    def _embed_frames_threaded(self, file_path, video_id, dedup, resume_from):
+        """
+        One decoder thread feeding the embedder through a bounded queue.
+        Yields (spans, vectors, frames seen so far) per batch.
+        """
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode_frames, args=(file_path, video_id, dedup, frame_queue, stop, resume_from), daemon=True)
+        decoder.start()
+        try:
+            # Consumer: embeds batches while the decoder keeps reading ahead
+            while True:
+                item = frame_queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                spans, frames = item
+                yield spans, self.vision.get_image_embeddings(frames, batch_size=self.batch_size), dedup.seen
+        finally:
+            stop.set()
+            # Drain so a blocked producer can exit
+            while decoder.is_alive():
+                try:
+                    frame_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            decoder.join()
+
+    def _embed_frames_sharded(self, file_path, video_id, dedup, resume_from):
+        """
+        Time-sharded decode + embed across decode_workers processes (long files).
+        Yields (spans, vectors, frames seen so far) per shard, in time order.
+        """
+        dedup_options = {"hash_threshold": dedup.hash_threshold, "hist_threshold": dedup.hist_threshold}
+        # Workers load the same model/precision; the int8 tolerance check already ran here
+        vision_options = {"model_name": self.vision.model_name, "precision": getattr(self.vision, "precision", "fp32"),
+                          "tolerance": None}
+        seen = 0
+        on_thumbnail = None
+        if self.previews:
+            def on_thumbnail(span, jpeg):
+                self.previews.put_thumbnail(video_id, span[0], jpeg)
+        shards = self.processor.iter_keyframe_shards(file_path, interval=self.frame_interval, workers=self.decode_workers,
+                                                     embed=vision_options, dedup_options=dedup_options, start_time=resume_from,
+                                                     batch_size=self.batch_size, thumbnail_callback=on_thumbnail)
+        for spans, vecs, shard_seen in shards:
+            seen += shard_seen
+            if spans:
+                yield spans, vecs, seen
+
+    def _run_visual(self, file_path, video_id, content_hash, report, result, manifest):
+        report("visual", 0.0, "Analyzing visual frames (AI Vision)...")
+        if manifest and manifest.stage_done("visual"):
+            result["frames"] = manifest.get("frames_done", 0)
+            report("visual", 1.0, None)
+            return
+        dedup = FrameDeduplicator()
+        frame_key = self._key(content_hash, "frame_embeddings", clip=self.vision.cache_tag, interval=self.frame_interval,
+                              hash_threshold=dedup.hash_threshold, hist_threshold=dedup.hist_threshold)
+        cached = self._load(frame_key, arrays=True)
+
+        if cached is not None:
+            spans = cached["spans"].tolist()
+            for start in range(0, len(spans), self.batch_size):
+                self._upload_frames(cached["vectors"][start:start + self.batch_size], spans[start:start + self.batch_size], video_id)
+            result["frames"] = len(spans)
+        else:
+            # Everything before frames_until is already upserted
+            resume_from = manifest.get("frames_until", 0.0) if manifest else 0.0
+            result["frames"] = manifest.get("frames_done", 0) if manifest else 0
+            _, _, duration = self.processor.get_video_info(file_path)
+            expected_frames = max(int((duration - resume_from) / self.frame_interval), 1)
+
+            if self.decode_workers > 1 and duration > 0:
+                batches = self._embed_frames_sharded(file_path, video_id, dedup, resume_from)
+            else:
+                if self.decode_workers > 1:
+                    # Some mkv/webm files report no frame count; shards need the duration to split on
+                    print(f"⚠️ Unknown duration for {file_path}, decoding it on one thread")
+                batches = self._embed_frames_threaded(file_path, video_id, dedup, resume_from)
+
+            # Only kept for the cache; the frames themselves are dropped after each batch
+            frame_vecs, frame_spans = [], []
+            for spans, vecs, seen in batches:
+                self._upload_frames(vecs, spans, video_id)
+                result["frames"] += len(spans)
+                if manifest:
+                    # The next kept frame starts where this batch's last span ends
+                    manifest.update(frames_until=spans[-1][1], frames_done=result["frames"])
+                if frame_key and resume_from == 0:
+                    frame_vecs.append(vecs)
+                    frame_spans.extend(spans)
+                report("visual", min(seen / expected_frames, 1.0), None)
+
+            if frame_vecs:
+                self.cache.put_arrays(frame_key, vectors=np.concatenate(frame_vecs), spans=frame_spans)
+
+        if manifest:
+            manifest.update(frames_done=result["frames"])
+            manifest.mark_done("visual")
+        report("visual", 1.0, None)
+
+    def _upload_frames(self, vectors, spans, video_id):
+        payloads = [{"timestamp": start, "end": end, "type": "frame"} for start, end in spans]
+        self.db.upload_vectors(vectors, payloads, "visual_search", video_id=video_id)
+
+    def start(self, file_path, video_id, **options):
+        """
+        Runs the pipeline on a background thread and returns an IngestionJob
+        right away; options are passed through to run().
+        """
+        job = IngestionJob()
+
+        def on_progress(fraction, message):
+            job.progress = fraction
+            if message:
+                job.message = message
+
+        def target():
+            try:
+                job.result = self.run(file_path, video_id, progress_callback=on_progress, **options)
+            except Exception as e:
+                job.error = e
+
+        job._thread = threading.Thread(target=target, daemon=True)
+        job._thread.start()
+        return job
+
+    def run(self, file_path, video_id, content_hash=None, is_audio=False, progress_callback=None,
+            replace=True, manifest=None):
+        """
+        Ingests one file. Point ids are derived from video id + timestamp, so
+        re-running is idempotent; replace=True also drops points a previous run
+        produced that this one won't (e.g. different sampling settings).
+        manifest: optional JobManifest; an unfinished one is resumed from its
+        checkpoints instead of starting over.
+        progress_callback: optional fn(fraction, message), always called from the calling
+        thread (Streamlit widgets can only be updated from the script thread).
+        Returns: {"transcript": [...], "segments": n, "frames": n}
+        """
+        resuming = manifest is not None and manifest.started and not manifest.complete
+        if resuming:
+            print(f"⏯️ Resuming {video_id} (done: {', '.join(manifest.get('stages')) or 'nothing yet'})")
+        elif manifest is not None:
+            manifest.reset()
+
+        if replace and not resuming:
+            self.db.delete_video(video_id)
+            if self.previews:
+                self.previews.remove_video(video_id)
+
+        branches = {"audio": self._run_audio}
+        if not is_audio:
+            branches["visual"] = self._run_visual
+
+        result = {"transcript": [], "segments": 0, "frames": 0}
+        events = queue.Queue()
+        errors = []
+
+        def report(branch, fraction, message):
+            events.put((branch, fraction, message))
+
+        def worker(name, branch_fn):
+            try:
+                with METRICS.span("ingest_branch", branch=name):
+                    branch_fn(file_path, video_id, content_hash, report, result, manifest)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                events.put(_DONE)
+
+        threads = [threading.Thread(target=worker, args=(name, fn), daemon=True) for name, fn in branches.items()]
+        for t in threads:
+            t.start()
+
+        # Combined progress is the mean of the branch fractions
+        fractions = {name: 0.0 for name in branches}
+        running = len(threads)
+        while running:
+            event = events.get()
+            if event is _DONE:
+                running -= 1
+                continue
+            branch, fraction, message = event
+            fractions[branch] = fraction
+            if progress_callback:
+                progress_callback(sum(fractions.values()) / len(fractions), message)
+
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+        if manifest is not None:
+            manifest.finish()
+        if self.library is not None and video_id in self.library:
+            self.library.mark_complete(video_id)
+        METRICS.inc("videos_ingested")
+
+        if progress_callback:
+            progress_callback(1.0, None)
+        return result
+
+
+class IngestionJob:
+    """Handle on a background pipeline run (see IngestionPipeline.start)"""
+    def __init__(self):
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self._thread = None
+
+    @property
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.done
@@ -0,0 +1,160 @@
+# File: ml_engine/previews.py
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from ml_engine.filelock import file_lock
+from ml_engine.metrics import METRICS
+
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_QUALITY = 70
+
+def encode_thumbnail(frame, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    """Downscales a BGR frame and returns it as JPEG bytes (small enough to pass between processes)"""
+    import cv2
+    height, frame_width = frame.shape[:2]
+    if frame_width > width:
+        frame = cv2.resize(frame, (width, max(1, round(height * width / frame_width))), interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes() if ok else None
+
+class PreviewStore:
+    """
+    Small per-timestamp thumbnails (written at ingest time) and short
+    low-bitrate preview clips (cut on first request), so result pages never
+    have to embed the full source file. Files are named by video id +
+    millisecond timestamp and evicted least-recently-used past max_bytes.
+    Several processes (app, ingest workers) may share the folder: each keeps
+    an in-memory LRU index of what it knows, and once that goes over budget
+    it rescans the folder under a file lock and evicts down to LOW_WATER, so
+    other processes' files count too and rescans stay rare.
+    """
+    LOW_WATER = 0.9
+    def __init__(self, folder="./previews", max_bytes=1024**3, clip_seconds=4):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.clip_seconds = clip_seconds
+        # Ingestion writes from a background thread while the UI reads
+        self._lock = threading.Lock()
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self._rescan()
+
+    def _rescan(self):
+        """Rebuilds the index (path -> size, least recently used first) from the folder's mtimes"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        self._index = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self.total_bytes = sum(self._index.values())
+
+    def _entries(self):
+        for name in os.listdir(self.folder):
+            if name.endswith((".jpg", ".mp4")):
+                yield os.path.join(self.folder, name)
+
+    def _path(self, video_id, timestamp, ext):
+        return os.path.join(self.folder, f"{video_id}_{int(round(timestamp * 1000))}{ext}")
+
+    def _lookup(self, path):
+        if not os.path.exists(path):
+            return None
+        # mtime keeps the LRU order across restarts
+        os.utime(path, None)
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+        return path
+
+    def _added(self, path):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            # Already evicted by another process sharing the folder
+            return
+        with self._lock:
+            self.total_bytes += size - self._index.pop(path, 0)
+            self._index[path] = size
+            if self.total_bytes <= self.max_bytes:
+                return
+            with file_lock(os.path.join(self.folder, ".lock")):
+                # Pick up what other processes wrote (or evicted) since the last scan
+                self._rescan()
+                if path in self._index:
+                    self._index.move_to_end(path)
+                while self.total_bytes > self.max_bytes * self.LOW_WATER and len(self._index) > 1:
+                    entry, entry_size = self._index.popitem(last=False)
+                    self.total_bytes -= entry_size
+                    try:
+                        os.remove(entry)
+                    except FileNotFoundError:
+                        pass
+
+    def put_thumbnail(self, video_id, timestamp, image):
+        """image: BGR frame or already-encoded JPEG bytes"""
+        jpeg = image if isinstance(image, bytes) else encode_thumbnail(image)
+        if not jpeg:
+            return None
+        path = self._path(video_id, timestamp, ".jpg")
+        with open(path + ".tmp", "wb") as f:
+            f.write(jpeg)
+        os.replace(path + ".tmp", path)
+        self._added(path)
+        return path
+
+    def thumbnail(self, video_id, timestamp, video_path=None):
+        """
+        Path of the thumbnail for a hit. Missing ones (evicted, audio hits,
+        features served from cache) are grabbed from video_path with a single
+        seek. Returns None for audio-only sources.
+        """
+        path = self._lookup(self._path(video_id, timestamp, ".jpg"))
+        if path or not video_path:
+            METRICS.inc("preview_thumbnail_hits" if path else "preview_thumbnail_misses")
+            return path
+        METRICS.inc("preview_thumbnail_misses")
+        import cv2
+        cap = cv2.VideoCapture(video_path)
+        try:
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            ok, frame = cap.read()
+        finally:
+            cap.release()
+        return self.put_thumbnail(video_id, timestamp, frame) if ok else None
+
+    def clip(self, video_id, start, video_path, ffmpeg="ffmpeg"):
+        """Short 360p preview clip starting at `start`, cut with ffmpeg on first request"""
+        path = self._lookup(self._path(video_id, start, ".mp4"))
+        if path:
+            return path
+        path = self._path(video_id, start, ".mp4")
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-ss", f"{max(start, 0):.3f}", "-i", video_path, "-t", str(self.clip_seconds),
+            "-vf", "scale=-2:360", "-c:v", "libx264", "-preset", "veryfast", "-crf", "32",
+            "-c:a", "aac", "-b:a", "48k", "-movflags", "+faststart",
+            "-f", "mp4", path + ".part",
+        ]
+        try:
+            with METRICS.span("preview_clip"):
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            print(f"⚠️ Could not cut preview clip for {video_id} at {start:.1f}s")
+            return None
+        os.replace(path + ".part", path)
+        self._added(path)
+        return path
+
+    def remove_video(self, video_id):
+        prefix = f"{video_id}_"
+        with self._lock:
+            for path in [p for p in self._index if os.path.basename(p).startswith(prefix)]:
+                self.total_bytes -= self._index.pop(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -3,6 +3,67 @@ import cv2
 import os
 import subprocess
 import sys
+import uuid
+import collections
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ml_engine.dedup import FrameDeduplicator
+from ml_engine.metrics import METRICS
+from ml_engine.previews import encode_thumbnail
+
+SAMPLE_RATE = 16000
+
+# --- Shard workers for iter_keyframe_shards (module level so they can be pickled) ---
+_shard_vision = None
+
+def _init_shard_worker(embed, threads):
+    global _shard_vision
+    cv2.setNumThreads(threads)
+    if embed:
+        import torch
+        from ml_engine.vision import VideoVision
+        torch.set_num_threads(threads)
+        # embed: True, or VideoVision kwargs (model / precision of the parent's instance)
+        _shard_vision = VideoVision(**(embed if isinstance(embed, dict) else {}))
+
+def _process_shard(job):
+    """
+    Samples one time range with its own capture; embeds it too if the worker has CLIP.
+    Returns (keys, frames or vectors, frames seen, thumbnails, metrics snapshot of this shard).
+    """
+    video_path, start, end, interval, dedup_options, batch_size, thumbnails = job
+    # This process's counters only cover the current shard, the parent merges them
+    METRICS.reset()
+    stream = VideoProcessor().iter_keyframes(video_path, interval=interval, start_time=start, end_time=end)
+    dedup = None
+    if dedup_options is not None:
+        dedup = FrameDeduplicator(**dedup_options)
+        stream = dedup.filter(stream, interval=interval, end_time=end)
+    thumbs = [] if thumbnails else None
+    if thumbnails:
+        stream = _with_thumbnails(stream, thumbs)
+
+    if _shard_vision is None:
+        keys, frames = [], []
+        for key, frame in stream:
+            keys.append(key)
+            frames.append(frame)
+        return keys, frames, dedup.seen if dedup else len(keys), thumbs, METRICS.snapshot()
+
+    keys, vecs = [], []
+    for batch_keys, batch_vecs in _shard_vision.iter_image_embeddings(stream, batch_size=batch_size):
+        keys.extend(batch_keys)
+        vecs.append(batch_vecs)
+    vecs = np.concatenate(vecs) if vecs else np.empty((0, 0), dtype=np.float32)
+    return keys, vecs, dedup.seen if dedup else len(keys), thumbs, METRICS.snapshot()
+
+def _with_thumbnails(stream, thumbs):
+    """Passes frames through, collecting a JPEG thumbnail of each on the way"""
+    for key, frame in stream:
+        thumbs.append(encode_thumbnail(frame))
+        yield key, frame
 
 class VideoProcessor:
     def __init__(self, temp_folder="temp_data"):
@@ -25,9 +86,10 @@ class VideoProcessor:
     def extract_audio(self, input_path):
         """
         Converts video/audio input to a standard WAV format for Whisper.
+        Each call writes its own file, so concurrent jobs never share one.
         """
         print(f"🔊 Processing audio track from: {input_path}")
-        audio_path = os.path.join(self.temp_folder, "processed_audio.wav")
+        audio_path = os.path.join(self.temp_folder, f"processed_audio_{uuid.uuid4().hex[:8]}.wav")
         
         # Get the correct path to the tool
         ffmpeg_exe = self._get_ffmpeg_path()
@@ -40,7 +102,8 @@ class VideoProcessor:
         
         try:
             # Run FFmpeg (hide ugly logs unless error)
-            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with METRICS.span("audio_decode", mode="wav"):
+                result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             
             if result.returncode != 0:
                 print(f"⚠️ FFmpeg failed. Error logs:\n{result.stderr.decode()}")
@@ -57,41 +120,171 @@ class VideoProcessor:
             print(f"⚠️ FFmpeg System Error: {e}")
             return None
 
-    def extract_keyframes(self, video_path, interval=2):
+    def _pcm_command(self, input_path):
+        # Raw 16-bit mono 16kHz PCM on stdout, no container, no temp file
+        return [
+            self._get_ffmpeg_path(), "-nostdin", "-i", input_path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-f", "s16le", "-acodec", "pcm_s16le", "-loglevel", "error", "-"
+        ]
+
+    def decode_audio(self, input_path):
         """
-        Extracts images. Returns empty list [] if file is audio-only.
+        In-memory alternative to extract_audio: returns the whole track as a
+        float32 array that AudioTranscriber accepts directly, or None on failure.
+        """
+        print(f"🔊 Decoding audio track in memory from: {input_path}")
+        try:
+            with METRICS.span("audio_decode", mode="pipe"):
+                result = subprocess.run(self._pcm_command(input_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            print(f"⚠️ FFmpeg System Error: {e}")
+            return None
+
+        if result.returncode != 0:
+            print(f"⚠️ FFmpeg failed. Error logs:\n{result.stderr.decode()}")
+            return None
+
+        raw = result.stdout[:len(result.stdout) - len(result.stdout) % 2]
+        if not raw:
+            print("❌ FFmpeg ran, but produced no audio.")
+            return None
+        return np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+
+    def get_video_info(self, video_path):
+        """
+        Returns (fps, frame_count, duration_seconds). Zeros if the file has no video stream.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return 0.0, 0, 0.0
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        cap.release()
+        duration = frame_count / fps if fps else 0.0
+        return fps, frame_count, duration
+
+    def iter_keyframes(self, video_path, interval=2, seek=False, start_time=0.0, end_time=None):
+        """
+        Streams sampled frames without touching the disk.
+        Yields (timestamp_seconds, BGR ndarray) for one frame every `interval` seconds.
+        Skipped frames are only grabbed (demuxed) and never converted; with seek=True
+        the capture jumps straight to the next sample time instead, which is faster
+        for large intervals on files with frequent keyframes.
+        start_time / end_time: only sample [start_time, end_time) (resume, time shards).
         """
-        print(f"🖼️ Attempting to extract frames from {video_path}...")
-        
         if not os.path.exists(video_path):
             print("❌ Video file not found.")
-            return []
+            return
 
         cap = cv2.VideoCapture(video_path)
-        
         if not cap.isOpened():
             print("ℹ️ CV2 could not open file (Likely Audio-Only).")
-            return []
+            return
 
         fps = cap.get(cv2.CAP_PROP_FPS)
         if fps == 0:
             cap.release()
-            return []
+            return
+
+        step = max(int(round(fps * interval)), 1)
+        index = 0
+        if start_time > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000.0)
+            index = int(start_time * fps)
+
+        try:
+            while True:
+                if seek and index > int(start_time * fps):
+                    cap.set(cv2.CAP_PROP_POS_MSEC, (index / fps) * 1000.0)
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                # Real presentation time of the decoded frame, falls back to index math
+                pos_msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+                timestamp = pos_msec / 1000.0 if pos_msec > 0 or index == 0 else index / fps
+                if end_time is not None and timestamp >= end_time:
+                    break
+                METRICS.inc("frames_sampled")
+                yield timestamp, frame
+
+                if not seek:
+                    # Advance to the next sample without decoding the frames in between
+                    for _ in range(step - 1):
+                        if not cap.grab():
+                            return
+                index += step
+        finally:
+            cap.release()
+
+    def iter_keyframe_shards(self, video_path, interval=2, workers=None, embed=False, dedup_options=None,
+                             start_time=0.0, batch_size=32, thumbnail_callback=None, shard_seconds=90):
+        """
+        Splits the video into short time ranges (about shard_seconds each) decoded by
+        a pool of worker processes; each shard opens its own capture, seeks to its range and samples it (and with
+        embed=True or a dict of VideoVision kwargs runs CLIP on it, so only vectors cross the process boundary).
+        Shards are handed back in time order as soon as they're done, so callers can
+        upload and checkpoint while the rest of the file is still being decoded.
+        dedup_options: FrameDeduplicator kwargs to dedup within each shard, None = off.
+        Yields (keys, frames_or_vectors, frames_seen) per shard, in time order.
+        Keys are timestamps, or (start, end) spans when dedup is on.
+        thumbnail_callback: optional fn(key, jpeg_bytes); workers encode a thumbnail
+        of every kept frame and it is called in this process before each shard is yielded.
+        """
+        _, _, duration = self.get_video_info(video_path)
+        if duration <= start_time:
+            return
+        workers = workers or os.cpu_count() or 1
+
+        # Shard edges on the sampling grid so no sample is taken twice or skipped
+        shard_steps = max(1, round(shard_seconds / interval))
+        edges = []
+        edge = start_time
+        while edge < duration:
+            edges.append(edge)
+            edge += interval * shard_steps
+        edges.append(None)
+        jobs = [(video_path, edges[i], edges[i + 1], interval, dedup_options, batch_size, thumbnail_callback is not None)
+                for i in range(len(edges) - 1)]
+
+        workers = min(workers, len(jobs))
+        print(f"🧩 Decoding {duration - start_time:.0f}s of video in {len(jobs)} time shards on {workers} processes...")
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn: forking a process that already holds torch threads can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_shard_worker, initargs=(embed, threads)) as pool:
+            # A few shards in flight per worker keeps them busy without buffering far ahead
+            pending = collections.deque()
+            jobs = iter(jobs)
+            for job in itertools.islice(jobs, workers * 2):
+                pending.append(pool.submit(_process_shard, job))
+            try:
+                while pending:
+                    keys, items, seen, thumbs, metrics = pending.popleft().result()
+                    METRICS.merge(metrics)
+                    for job in itertools.islice(jobs, 1):
+                        pending.append(pool.submit(_process_shard, job))
+                    if thumbs:
+                        for key, jpeg in zip(keys, thumbs):
+                            thumbnail_callback(key, jpeg)
+                    yield keys, items, seen
+            finally:
+                # A failed shard (or a caller that stops early) shouldn't wait for the queued ones
+                for future in pending:
+                    future.cancel()
+
+    def extract_keyframes(self, video_path, interval=2):
+        """
+        Extracts images. Returns empty list [] if file is audio-only.
+        """
+        print(f"🖼️ Attempting to extract frames from {video_path}...")
 
         frame_paths = []
-        count = 0
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if int(count % (fps * interval)) == 0:
-                frame_filename = os.path.join(self.temp_folder, f"frame_{len(frame_paths)}.jpg")
-                cv2.imwrite(frame_filename, frame)
-                frame_paths.append(frame_filename)
-            count += 1
-            
-        cap.release()
+        for _, frame in self.iter_keyframes(video_path, interval=interval):
+            frame_filename = os.path.join(self.temp_folder, f"frame_{len(frame_paths)}.jpg")
+            cv2.imwrite(frame_filename, frame)
+            frame_paths.append(frame_filename)
+
         print(f"✅ Extracted {len(frame_paths)} visual frames.")
-        return frame_paths
\ No newline at end of file
+        return frame_paths
@@ -0,0 +1,35 @@
+# File: ml_engine/quantize.py
+import torch
+
+PRECISIONS = ("fp32", "int8")
+
+def quantize_linear_layers(model):
+    """
+    Dynamic int8 quantization for CPU inference: Linear weights are stored
+    as int8 and activations are quantized on the fly per batch. Subclassed
+    Linear layers (e.g. Whisper's) are turned back into plain nn.Linear first
+    so torch recognizes them; torch's own subclasses (the attention output
+    projection) are left alone because their weights are read directly.
+    """
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and not type(module).__module__.startswith("torch."):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def cosine_similarities(a, b):
+    """Row-wise cosine similarity of two (n, dim) arrays/tensors"""
+    a = torch.as_tensor(a, dtype=torch.float32).reshape(len(a), -1)
+    b = torch.as_tensor(b, dtype=torch.float32).reshape(len(b), -1)
+    return torch.nn.functional.cosine_similarity(a, b, dim=1)
+
+def check_tolerance(name, reference, candidate, tolerance):
+    """
+    Compares outputs of the fp32 and quantized paths on the same probes.
+    Returns True when every row keeps cosine similarity >= 1 - tolerance.
+    """
+    sims = cosine_similarities(reference, candidate)
+    worst = float(sims.min())
+    ok = worst >= 1 - tolerance
+    print(f"{'✅' if ok else '⚠️'} {name} int8 vs fp32: min cosine {worst:.4f} (mean {float(sims.mean()):.4f}, "
+          f"tolerance {tolerance})")
+    return ok
@@ -0,0 +1,97 @@
+# File: ml_engine/registry.py
+import importlib
+import threading
+from ml_engine.metrics import METRICS
+
+# name -> (module, class); imported on first use so torch/whisper/clip/cv2 stay out of startup
+BUILDERS = {
+    "vision": ("ml_engine.vision", "VideoVision"),
+    "audio": ("ml_engine.audio", "AudioTranscriber"),
+    "db": ("ml_engine.store", "VectorDB"),
+    "processor": ("ml_engine.processing", "VideoProcessor"),
+    "downloader": ("ml_engine.downloader", "VideoDownloader"),
+}
+
+class Lazy:
+    """
+    Stand-in that builds its target on first attribute access, then forwards
+    everything to it. Lets callers wire objects together (pipelines, search
+    engines) without paying for model loads up front.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+class ModelRegistry:
+    """
+    Process-wide cache of heavy objects (CLIP, Whisper, vector DB handles),
+    one instance per name + constructor options. Every session, search
+    service or pipeline in the process shares the same copy; concurrent
+    first requests wait for a single load instead of loading twice.
+    """
+    def __init__(self, builders=BUILDERS):
+        self.builders = dict(builders)
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._preload_thread = None
+
+    def _key(self, name, options):
+        return (name, tuple(sorted(options.items())))
+
+    def get(self, name, **options):
+        """Returns the shared instance, building it on first use"""
+        key = self._key(name, options)
+        if key in self._instances:
+            return self._instances[key]
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._instances:
+                module_name, class_name = self.builders[name]
+                with METRICS.span("model_load", model=name):
+                    cls = getattr(importlib.import_module(module_name), class_name)
+                    self._instances[key] = cls(**options)
+        return self._instances[key]
+
+    def lazy(self, name, **options):
+        """Lazy handle on get(name, **options)"""
+        return Lazy(lambda: self.get(name, **options))
+
+    def loaded(self, name, **options):
+        return self._key(name, options) in self._instances
+
+    def preload(self, handles):
+        """
+        Resolves Lazy handles (or calls plain fns) one after another on a
+        background thread, once per process; returns the thread.
+        """
+        with self._lock:
+            if self._preload_thread is None:
+                def target():
+                    for handle in handles:
+                        try:
+                            handle.resolve() if isinstance(handle, Lazy) else handle()
+                        except Exception as e:
+                            # Surfaced again (with traceback) when the object is first used
+                            print(f"⚠️ Background preload failed: {e}")
+                self._preload_thread = threading.Thread(target=target, daemon=True)
+                self._preload_thread.start()
+        return self._preload_thread
+
+REGISTRY = ModelRegistry()
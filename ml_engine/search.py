@@ -0,0 +1,127 @@
+# File: ml_engine/search.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ml_engine.metrics import METRICS
+
+# Modality name -> vector collection
+MODALITIES = {"visual": "visual_search", "audio": "audio_search"}
+
+def normalize_scores(hits):
+    """
+    Min-max scales one collection's scores to [0, 1]. CLIP image-text and
+    text-text similarities live on very different ranges, so raw scores
+    can't be compared across collections.
+    """
+    if not hits:
+        return []
+    scores = [hit.score for hit in hits]
+    low, high = min(scores), max(scores)
+    if high - low < 1e-9:
+        return [1.0] * len(hits)
+    return [(s - low) / (high - low) for s in scores]
+
+def aggregate_hits(hits_by_modality, max_gap=2.0, max_span=60.0, score_mode="max"):
+    """
+    Turns point hits into ranked time ranges. Hits (all modalities together)
+    are sorted per video and chained while each one starts within max_gap
+    seconds of the range's end; ranges are cut at max_span so a long static
+    scene doesn't swallow a whole video.
+    A range's score adds up its modalities, each being the max (or, with
+    score_mode="sum", the sum) of its members' normalized scores, so frames
+    with overlapping transcript hits outrank frames alone.
+    Returns [{"video_id", "start", "end", "score", "scores", "best", "hits"}],
+    best = timestamp of the top frame (top hit when there are no frames).
+    """
+    if score_mode not in ("max", "sum"):
+        raise ValueError(f"Unknown score_mode: {score_mode}")
+    items = []
+    for modality, hits in hits_by_modality.items():
+        for hit, score in zip(hits, normalize_scores(hits)):
+            payload = hit.payload
+            start = payload["timestamp"]
+            items.append({
+                "video_id": payload.get("video_id"), "modality": modality, "timestamp": start,
+                "end": payload.get("end", start), "score": float(hit.score), "normalized": score,
+                "text": payload.get("text"),
+            })
+    items.sort(key=lambda h: (str(h["video_id"]), h["timestamp"]))
+
+    ranges = []
+    for item in items:
+        current = ranges[-1] if ranges else None
+        if (current is None or current["video_id"] != item["video_id"]
+                or item["timestamp"] > current["end"] + max_gap
+                or item["end"] - current["start"] > max_span):
+            current = {"video_id": item["video_id"], "start": item["timestamp"], "end": item["end"], "hits": []}
+            ranges.append(current)
+        current["end"] = max(current["end"], item["end"])
+        current["hits"].append(item)
+
+    combine = max if score_mode == "max" else sum
+    for r in ranges:
+        by_modality = {}
+        for h in r["hits"]:
+            by_modality.setdefault(h["modality"], []).append(h["normalized"])
+        r["scores"] = {m: combine(scores) for m, scores in by_modality.items()}
+        r["score"] = sum(r["scores"].values())
+        frames = [h for h in r["hits"] if h["modality"] == "visual"] or r["hits"]
+        r["best"] = max(frames, key=lambda h: h["normalized"])["timestamp"]
+    ranges.sort(key=lambda r: r["score"], reverse=True)
+    return ranges
+
+class SearchEngine:
+    """
+    One query -> one fused ranking over every modality. The query is embedded
+    once, the visual and audio collections are searched concurrently, scores
+    are normalized per collection and hits are merged into time ranges
+    (see aggregate_hits), so places where picture and speech agree rank first.
+    Holds no per-session state; safe to share between threads.
+    """
+    def __init__(self, vision, db, library=None, candidates=50, max_gap=2.0, score_mode="max"):
+        self.vision = vision
+        self.db = db
+        self.library = library
+        self.candidates = candidates
+        self.max_gap = max_gap
+        self.score_mode = score_mode
+        self.pool = ThreadPoolExecutor(max_workers=len(MODALITIES))
+
+    def _describe(self, ranges):
+        if self.library is not None:
+            for r in ranges:
+                video = self.library.get(r["video_id"])
+                r["source"] = video["source"] if video else None
+        return ranges
+
+    def search(self, query, video_ids=None, modalities=tuple(MODALITIES), page=1, page_size=10, max_gap=None):
+        """
+        video_ids: None = whole library, or a str/list to filter on.
+        modalities: subset of ("visual", "audio").
+        max_gap: seconds between hits that still belong to one range.
+        Returns {"query", "page", "page_size", "total", "results", "took_ms"}; each
+        result is a time range as returned by aggregate_hits.
+        """
+        started = time.perf_counter()
+        unknown = set(modalities) - set(MODALITIES)
+        if unknown:
+            raise ValueError(f"Unknown modality: {', '.join(sorted(unknown))}")
+
+        with METRICS.span("search_request"):
+            query_vec = self.vision.embed_query(query)
+            # Fetch enough candidates to fill the requested page after grouping
+            top_k = max(self.candidates, page * page_size)
+            futures = {m: self.pool.submit(self.db.search, query_vec, MODALITIES[m], top_k=top_k, video_ids=video_ids)
+                       for m in modalities}
+            hits = {m: f.result() for m, f in futures.items()}
+            results = aggregate_hits(hits, max_gap=self.max_gap if max_gap is None else max_gap, score_mode=self.score_mode)
+
+        offset = (page - 1) * page_size
+        METRICS.inc("search_requests")
+        return {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": len(results),
+            "results": self._describe(results[offset:offset + page_size]),
+            "took_ms": (time.perf_counter() - started) * 1000,
+        }
@@ -1,51 +1,88 @@
 # File: ml_engine/store.py
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
+import contextlib
+import threading
+import uuid
+from ml_engine.backends import QdrantBackend, NumpyBackend
+from ml_engine.metrics import METRICS
+
+COLLECTIONS = ("visual_search", "audio_search")
+
+def make_point_id(video_id, collection_name, timestamp, end=None):
+    """
+    Deterministic point id from video + time, so re-uploading the same
+    segment/frame overwrites it instead of adding a duplicate.
+    """
+    key = f"{video_id}/{collection_name}/{timestamp:.3f}"
+    if end is not None:
+        key += f"-{end:.3f}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
 
 class VectorDB:
-    def __init__(self):
-        # Local persistent storage
-        self.client = QdrantClient(path="./qdrant_db")
+    def __init__(self, backend="qdrant", **backend_options):
+        """
+        backend: "qdrant" (local Qdrant in ./qdrant_db) or "numpy"
+        (memory-mapped float16/int8 matrices in ./vector_db, see NumpyBackend)
+        """
+        if backend == "qdrant":
+            self.backend = QdrantBackend(**backend_options)
+        elif backend == "numpy":
+            self.backend = NumpyBackend(**backend_options)
+        else:
+            raise ValueError(f"Unknown vector backend: {backend}")
+        # Ingestion threads write while the UI searches; local Qdrant is not thread-safe
+        self._lock = threading.RLock()
         
         # Ensure collections exist on startup
         self._ensure_collection("visual_search", 512)
         self._ensure_collection("audio_search", 512)
 
     def _ensure_collection(self, name, size):
-        """Creates collection if it doesn't exist"""
-        if not self.client.collection_exists(name):
-            self.client.create_collection(
-                collection_name=name,
-                vectors_config=VectorParams(size=size, distance=Distance.COSINE)
-            )
+        """Creates collection (and its video_id index) if it doesn't exist"""
+        with self._lock:
+            self.backend.ensure_collection(name, size)
 
     def reset_db(self):
         """⚠️ Deletes all data and re-creates empty collections"""
         print(f"🧹 Wiping database...")
         # Delete old collections
-        self.client.delete_collection("visual_search")
-        self.client.delete_collection("audio_search")
+        with self._lock:
+            self.backend.delete_collection("visual_search")
+            self.backend.delete_collection("audio_search")
         
         # Re-create fresh ones
         self._ensure_collection("visual_search", 512)
         self._ensure_collection("audio_search", 512)
         print("✨ Database is clean and ready for new video.")
 
-    def upload_vectors(self, vectors, payloads, collection_name):
+    def delete_video(self, video_id):
+        """Removes one video's points from every collection, leaves the rest of the library alone"""
+        with self._lock:
+            for name in COLLECTIONS:
+                self.backend.delete_video(name, video_id)
+
+    def has_video(self, video_id, collection_name="audio_search"):
+        with self._lock:
+            return self.backend.count(collection_name, video_id) > 0
+
+    def upload_vectors(self, vectors, payloads, collection_name, video_id=None):
         """
         vectors: list of lists (embeddings)
         payloads: list of dicts (metadata like timestamp, text)
+        video_id: tags every payload so the points can be scoped/replaced per video,
+                  and gives every point a stable id (upload is then an idempotent upsert)
         """
+        ids = None
+        if video_id is not None:
+            payloads = [dict(p, video_id=video_id) for p in payloads]
+            ids = [make_point_id(video_id, collection_name, p["timestamp"], p.get("end")) for p in payloads]
+
         # Batch upload for speed
-        self.client.upload_collection(
-            collection_name=collection_name,
-            vectors=vectors,
-            payload=payloads
-        )
-
-    def search(self, query_vector, collection_name, top_k=3):
-        return self.client.search(
-            collection_name=collection_name,
-            query_vector=query_vector,
-            limit=top_k
-        )
\ No newline at end of file
+        with self._lock, METRICS.span("db_upload", collection=collection_name):
+            self.backend.upload(collection_name, vectors, payloads, ids=ids)
+        METRICS.inc("vectors_uploaded", len(payloads), collection=collection_name)
+
+    def search(self, query_vector, collection_name, top_k=3, video_ids=None):
+        """video_ids: None searches the whole library, a str or list scopes the search"""
+        lock = contextlib.nullcontext() if self.backend.concurrent_search else self._lock
+        with lock, METRICS.span("search", collection=collection_name):
+            return self.backend.search(collection_name, query_vector, top_k, video_ids=video_ids)
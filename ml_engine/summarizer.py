@@ -0,0 +1,143 @@
+# File: ml_engine/summarizer.py
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from ml_engine.metrics import METRICS
+
+# Bump whenever the prompts change so cached summaries are not reused
+PROMPT_VERSION = "v1"
+
+CHUNK_PROMPT = """
+Transcript excerpt ({start} - {end}): <transcript>{text}</transcript>
+Task: Summarize this part of the video in 3-6 concise bullet points. Keep names, numbers and decisions. Mention the timestamps of key moments.
+"""
+
+REDUCE_PROMPT = """
+Partial summaries of consecutive parts of one video, in order: <summaries>{text}</summaries>
+Task: Merge them into one set of bullet points for the whole range, dropping repetition. Keep timestamps of key moments.
+"""
+
+FINAL_PROMPT = """
+Transcript: <transcript>{text}</transcript>
+Task: Create a beautiful, structured summary. Use Markdown headers and bullet points.
+"""
+
+FINAL_REDUCE_PROMPT = """
+Section summaries of one video, in order: <summaries>{text}</summaries>
+Task: Create a beautiful, structured summary of the whole video. Use Markdown headers and bullet points.
+"""
+
+def _clock(seconds):
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
+
+def chunk_transcript(segments, chunk_seconds=300, max_chars=12000):
+    """
+    Groups Whisper segments into consecutive time windows of at most chunk_seconds
+    (and max_chars of text, so a dense window still fits one prompt).
+    Returns [{"start", "end", "text"}] with "[mm:ss] ..." lines.
+    """
+    chunks, lines, start, size = [], [], None, 0
+    for seg in segments:
+        line = f"[{_clock(seg['start'])}] {seg['text'].strip()}"
+        if lines and (seg['start'] - start >= chunk_seconds or size + len(line) > max_chars):
+            chunks.append({"start": start, "end": end, "text": "\n".join(lines)})
+            lines, size = [], 0
+        if not lines:
+            start = seg['start']
+        lines.append(line)
+        size += len(line) + 1
+        end = seg['end']
+    if lines:
+        chunks.append({"start": start, "end": end, "text": "\n".join(lines)})
+    return chunks
+
+class TranscriptSummarizer:
+    """
+    Map-reduce summaries for transcripts of any length: time chunks are
+    summarized concurrently, partial summaries are merged reduce_fanin at a
+    time until one final pass is left. Chunk and final summaries are cached
+    (FeatureCache) by content hash + model + prompt version, so re-clicking
+    or re-summarizing a mostly unchanged transcript is cheap.
+    client: any OpenAI-style client (Groq, OpenAI, a local OpenAI-compatible
+    server via base_url, or a fake) exposing chat.completions.create(messages=, model=).
+    """
+    def __init__(self, client, model="llama-3.3-70b-versatile", cache=None, chunk_seconds=300,
+                 max_chars=12000, workers=4, reduce_fanin=8):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.chunk_seconds = chunk_seconds
+        self.max_chars = max_chars
+        self.workers = workers
+        self.reduce_fanin = reduce_fanin
+
+    def _key(self, text, kind):
+        if self.cache is None:
+            return None
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return self.cache.key(text_hash, kind, model=self.model, prompt=PROMPT_VERSION)
+
+    def _complete(self, prompt):
+        with METRICS.span("llm_call", model=self.model):
+            completion = self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=self.model
+            )
+        return completion.choices[0].message.content
+
+    def _cached_map(self, prompts, kind, progress_callback=None):
+        """Runs prompts concurrently, serving and storing each result through the cache"""
+        keys = [self._key(p, kind) for p in prompts]
+        results = [self.cache.get_json(k) if k else None for k in keys]
+        METRICS.inc("summary_cache_hits", sum(r is not None for r in results))
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as pool:
+                for i, text in zip(todo, pool.map(lambda i: self._complete(prompts[i]), todo)):
+                    results[i] = text
+                    if keys[i]:
+                        self.cache.put_json(keys[i], text)
+                    if progress_callback:
+                        progress_callback(i)
+        return results
+
+    def summarize(self, segments, progress_callback=None):
+        """
+        segments: Whisper-style [{"start", "end", "text"}].
+        progress_callback: optional fn(fraction, message).
+        Returns the Markdown summary.
+        """
+        chunks = chunk_transcript(segments, self.chunk_seconds, self.max_chars)
+        if not chunks:
+            return ""
+        # The whole transcript (times included) identifies the final summary
+        final_key = self._key(json.dumps([[c["start"], c["text"]] for c in chunks]), f"summary_{self.chunk_seconds}")
+        cached = self.cache.get_json(final_key) if final_key else None
+        if cached is not None:
+            METRICS.inc("summary_cache_hits")
+            return cached
+
+        if len(chunks) == 1:
+            # Short transcript: one call, same as before
+            summary = self._complete(FINAL_PROMPT.format(text=chunks[0]["text"]))
+        else:
+            # Map: one summary per time chunk
+            done = []
+            def on_chunk(_):
+                done.append(1)
+                if progress_callback:
+                    progress_callback(len(done) / (len(chunks) + 1), f"Summarized part {len(done)}/{len(chunks)}")
+            prompts = [CHUNK_PROMPT.format(start=_clock(c["start"]), end=_clock(c["end"]), text=c["text"]) for c in chunks]
+            parts = self._cached_map(prompts, "chunk_summary", on_chunk)
+
+            # Reduce: merge reduce_fanin partial summaries at a time until one pass is enough
+            while len(parts) > self.reduce_fanin:
+                groups = [parts[i:i + self.reduce_fanin] for i in range(0, len(parts), self.reduce_fanin)]
+                parts = self._cached_map([REDUCE_PROMPT.format(text="\n\n".join(g)) for g in groups], "reduce_summary")
+            summary = self._complete(FINAL_REDUCE_PROMPT.format(text="\n\n".join(parts)))
+
+        if final_key:
+            self.cache.put_json(final_key, summary)
+        if progress_callback:
+            progress_callback(1.0, None)
+        return summary
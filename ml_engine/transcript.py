@@ -0,0 +1,45 @@
+# File: ml_engine/transcript.py
+
+# CLIP's text context is 77 tokens including the start/end markers
+CLIP_TEXT_TOKENS = 75
+
+def approx_token_count(text):
+    """Rough BPE count (~4 tokens per 3 words) for when no tokenizer is at hand"""
+    return (len(text.split()) * 4 + 2) // 3
+
+def build_transcript_windows(segments, max_tokens=CLIP_TEXT_TOKENS, overlap_tokens=24, max_seconds=30.0,
+                             count_tokens=approx_token_count):
+    """
+    Merges consecutive Whisper segments into overlapping windows that fit one
+    CLIP text context, so a sentence split across segments is embedded whole.
+    A window grows until the next segment would exceed max_tokens or
+    max_seconds; the next window restarts on the trailing segments worth at
+    most overlap_tokens (always moving forward by at least one segment).
+    A single segment longer than max_tokens becomes its own window.
+    Returns [{"start", "end", "text", "segment_ids"}].
+    """
+    tokens = [count_tokens(s["text"]) for s in segments]
+    windows = []
+    first = 0
+    while first < len(segments):
+        last, used = first, tokens[first]
+        while (last + 1 < len(segments) and used + tokens[last + 1] <= max_tokens
+               and segments[last + 1]["end"] - segments[first]["start"] <= max_seconds):
+            last += 1
+            used += tokens[last]
+        members = segments[first:last + 1]
+        windows.append({
+            "start": members[0]["start"],
+            "end": members[-1]["end"],
+            "text": " ".join(s["text"].strip() for s in members),
+            "segment_ids": [s.get("id", first + i) for i, s in enumerate(members)],
+        })
+        if last + 1 >= len(segments):
+            break
+        # Step back over the tail that fits in the overlap budget
+        next_first, tail = last + 1, 0
+        while next_first - 1 > first and tail + tokens[next_first - 1] <= overlap_tokens:
+            next_first -= 1
+            tail += tokens[next_first]
+        first = next_first
+    return windows
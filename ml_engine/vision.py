@@ -1,24 +1,211 @@
+import copy
+import threading
 import torch
 import clip
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from ml_engine.metrics import METRICS
+from ml_engine.quantize import PRECISIONS, quantize_linear_layers, check_tolerance
+
+PROBE_TEXTS = [
+    "a person talking to the camera", "a red car on the street", "a slide with a chart",
+    "two people shaking hands", "a dog running in a park", "a close-up of a laptop screen",
+    "a crowded conference room", "text on a whiteboard",
+]
 
 class VideoVision:
-    def __init__(self):
+    def __init__(self, model_name="ViT-B/32", preprocess_workers=4, query_cache_size=1024, precision="fp32",
+                 tolerance=0.02):
+        """
+        precision: "fp32", or "int8" for dynamically quantized Linear layers on CPU.
+        The int8 model is only kept if its embeddings of a fixed probe set stay
+        within `tolerance` (1 - cosine similarity) of fp32, otherwise fp32 is used
+        (tolerance=None skips the check).
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
         print("Loading CLIP model...")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model, self.preprocess = clip.load("ViT-B/32", device=self.device, jit=False)
+        self.model_name = model_name
+        self.model, self.preprocess = clip.load(model_name, device=self.device, jit=False)
+        self.preprocess_workers = preprocess_workers
+        self.precision = "fp32"
+        if precision == "int8":
+            self._quantize(tolerance)
+
+        # LRU of query embeddings, shared by every session using this instance
+        self.query_cache_size = query_cache_size
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self._tokenizer = None
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    @property
+    def cache_tag(self):
+        """Identifies the embedding model + precision for cache keys"""
+        return self.model_name if self.precision == "fp32" else f"{self.model_name}-{self.precision}"
+
+    def _probe_batch(self):
+        """Deterministic synthetic images + fixed captions to compare fp32 and int8 outputs on"""
+        rng = np.random.default_rng(0)
+        images = []
+        for i in range(8):
+            gradient = np.linspace(0, 255, 224, dtype=np.float32)
+            image = np.stack([np.outer(gradient, np.ones(224)) * (i % 3 == c) for c in range(3)], axis=-1)
+            image[rng.integers(0, 160):, rng.integers(0, 160):] = rng.integers(0, 255, 3)
+            images.append(self.preprocess(Image.fromarray(image.astype(np.uint8))))
+        return torch.stack(images), clip.tokenize(PROBE_TEXTS)
+
+    def _quantize(self, tolerance):
+        if self.device != "cpu":
+            print("ℹ️ int8 inference is CPU-only, keeping fp32 on GPU.")
+            return
+        quantized = quantize_linear_layers(copy.deepcopy(self.model).eval())
+        if tolerance is None:
+            self.model, self.precision = quantized, "int8"
+            return
+        images, texts = self._probe_batch()
+        with torch.no_grad():
+            image_ok = check_tolerance("CLIP image", self.model.encode_image(images), quantized.encode_image(images), tolerance)
+            text_ok = check_tolerance("CLIP text", self.model.encode_text(texts), quantized.encode_text(texts), tolerance)
+        if image_ok and text_ok:
+            self.model = quantized
+            self.precision = "int8"
+        else:
+            print("⚠️ Keeping fp32 CLIP, int8 drifted past the tolerance.")
+
+    def _load_image(self, frame):
+        """Accepts a file path, a PIL image or a BGR ndarray (as returned by cv2)."""
+        if isinstance(frame, Image.Image):
+            return frame
+        if isinstance(frame, np.ndarray):
+            # OpenCV frames are BGR, CLIP expects RGB
+            return Image.fromarray(np.ascontiguousarray(frame[:, :, ::-1]))
+        return Image.open(frame)
+
+    def _preprocess_frame(self, frame):
+        return self.preprocess(self._load_image(frame))
 
     def get_image_embedding(self, image_path):
-        image = self.preprocess(Image.open(image_path)).unsqueeze(0).to(self.device)
+        image = self.preprocess(self._load_image(image_path)).unsqueeze(0).to(self.device)
         with torch.no_grad():
             image_features = self.model.encode_image(image)
         return image_features.cpu().numpy().tolist()[0]
 
+    def get_image_embeddings(self, frames, batch_size=32, progress_callback=None):
+        """
+        Embeds many frames with one forward pass per batch.
+        frames: list of image paths / PIL images / BGR ndarrays
+        progress_callback: optional fn(done, total) called after every batch
+        Returns: float32 array of shape (len(frames), dim)
+        """
+        total = len(frames)
+        if total == 0:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batches = []
+        with ThreadPoolExecutor(max_workers=self.preprocess_workers) as pool:
+            for start in range(0, total, batch_size):
+                chunk = frames[start:start + batch_size]
+                # Decode + resize + normalize in parallel, the model runs on the stacked tensor
+                with METRICS.span("embed_image_batch"):
+                    images = torch.stack(list(pool.map(self._preprocess_frame, chunk))).to(self.device)
+                    with torch.no_grad():
+                        features = self.model.encode_image(images)
+                    batches.append(features.float().cpu().numpy())
+                METRICS.inc("frames_embedded", len(chunk))
+
+                if progress_callback:
+                    progress_callback(min(start + batch_size, total), total)
+
+        return np.ascontiguousarray(np.concatenate(batches), dtype=np.float32)
+
+    def iter_image_embeddings(self, frame_stream, batch_size=32):
+        """
+        Embeds a (key, frame) stream batch by batch so only one batch of
+        decoded frames is held in memory at a time. The key is passed through
+        untouched (a timestamp, or a (start, end) span from FrameDeduplicator).
+        Yields (keys, float32 array) per batch.
+        """
+        keys, frames = [], []
+        for key, frame in frame_stream:
+            keys.append(key)
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield keys, self.get_image_embeddings(frames, batch_size=batch_size)
+                keys, frames = [], []
+        if frames:
+            yield keys, self.get_image_embeddings(frames, batch_size=batch_size)
+
     def get_text_embedding(self, text_query):
         text = clip.tokenize([text_query]).to(self.device)
         with torch.no_grad():
             text_features = self.model.encode_text(text)
         return text_features.cpu().numpy().tolist()[0]
 
+    def embed_query(self, query):
+        """
+        Cached get_text_embedding for search queries. Queries that only differ
+        in case or whitespace share an entry.
+        """
+        key = (self.model_name, " ".join(query.lower().split()))
+        with self._query_lock:
+            if key in self._query_cache:
+                self._query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+                METRICS.inc("query_cache_hits")
+                return self._query_cache[key]
+            self.query_cache_misses += 1
+        METRICS.inc("query_cache_misses")
+
+        with METRICS.span("query_embed"):
+            vector = self.get_text_embedding(query)
+
+        with self._query_lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def count_tokens(self, text):
+        """CLIP BPE tokens in text, without the start/end markers (context holds 75)"""
+        from clip.simple_tokenizer import SimpleTokenizer
+        if self._tokenizer is None:
+            self._tokenizer = SimpleTokenizer()
+        return len(self._tokenizer.encode(text))
+
+    def warm_up(self):
+        """Runs one throwaway text pass so the first real query doesn't pay for lazy init"""
+        self.get_text_embedding("warm up")
+
+    def get_text_embeddings(self, texts, batch_size=256, progress_callback=None):
+        """
+        Embeds many strings (e.g. transcript segments) in batches.
+        Returns: float32 array of shape (len(texts), dim)
+        """
+        total = len(texts)
+        if total == 0:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Tokenize everything once; long segments are cut at CLIP's 77 token context
+        tokens = clip.tokenize(list(texts), truncate=True)
+
+        batches = []
+        for start in range(0, total, batch_size):
+            chunk = tokens[start:start + batch_size].to(self.device)
+            with METRICS.span("embed_text_batch"), torch.no_grad():
+                features = self.model.encode_text(chunk)
+            batches.append(features.float().cpu().numpy())
+            METRICS.inc("segments_embedded", len(chunk))
+
+            if progress_callback:
+                progress_callback(min(start + batch_size, total), total)
+
+        return np.ascontiguousarray(np.concatenate(batches), dtype=np.float32)
+
 if __name__ == "__main__":
-    print("Vision module is ready.")
\ No newline at end of file
+    print("Vision module is ready.")
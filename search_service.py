@@ -0,0 +1,104 @@
+# File: search_service.py
+"""
+Long-lived search API over the indexed library.
+
+    python search_service.py --port 8765 --backend numpy
+    curl "http://127.0.0.1:8765/search?q=red+car&video_id=ab12cd34ef56ab78&page=1&page_size=10"
+
+CLIP and the vector DB are loaded once at startup, so a request only pays
+for one text embedding (LRU-cached) plus the collection searches. With the
+numpy backend, videos the app or ingest.py index while the service runs show
+up on the next request (each search checks meta.json / videos.json first).
+
+Endpoints:
+    GET /search   q, video_id (repeatable), modality (visual/audio, repeatable),
+                  page, page_size, max_gap (seconds between hits of one result range)
+    GET /health
+    GET /metrics  Prometheus text format
+
+Local Qdrant allows a single process per folder: with --backend qdrant the
+service can't start while the app or ingest.py has the folder open, and
+those can't index until it stops. Use the numpy backend to run them together.
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MAX_PAGE_SIZE = 100
+
+class SearchHandler(BaseHTTPRequestHandler):
+    engine = None
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        from ml_engine.metrics import METRICS
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == "/health":
+            return self._send(200, {"status": "ok"})
+        if url.path == "/metrics":
+            return self._send(200, METRICS.prometheus_text(), content_type="text/plain; version=0.0.4")
+        if url.path != "/search":
+            return self._send(404, {"error": "not found"})
+
+        query = params.get("q", [""])[0].strip()
+        if not query:
+            return self._send(400, {"error": "missing q"})
+        try:
+            page = max(int(params.get("page", ["1"])[0]), 1)
+            page_size = min(max(int(params.get("page_size", ["10"])[0]), 1), MAX_PAGE_SIZE)
+            max_gap = float(params["max_gap"][0]) if "max_gap" in params else None
+            modalities = [m for value in params.get("modality", ["visual,audio"]) for m in value.split(",") if m]
+            video_ids = params.get("video_id") or None
+            result = self.engine.search(query, video_ids=video_ids, modalities=modalities,
+                                        page=page, page_size=page_size, max_gap=max_gap)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        # Keep stdout for startup messages; per-request timings go to /metrics
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fused visual + audio search over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", default="qdrant", choices=["qdrant", "numpy"], help="vector storage engine")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8"], help="CLIP inference precision on CPU")
+    parser.add_argument("--candidates", type=int, default=50, help="hits fetched per collection before grouping")
+    parser.add_argument("--max-gap", type=float, default=2.0, help="seconds between hits merged into one result range")
+    parser.add_argument("--score-mode", default="max", choices=["max", "sum"], help="how a range combines its hits")
+    args = parser.parse_args(argv)
+
+    from ml_engine.registry import REGISTRY
+    from ml_engine.library import VideoLibrary
+    from ml_engine.search import SearchEngine
+
+    print("🧠 Loading CLIP and the vector DB...")
+    vision = REGISTRY.get("vision", precision=args.precision)
+    vision.warm_up()
+    SearchHandler.engine = SearchEngine(vision, REGISTRY.get("db", backend=args.backend), library=VideoLibrary(),
+                                        candidates=args.candidates, max_gap=args.max_gap, score_mode=args.score_mode)
+
+    server = ThreadingHTTPServer((args.host, args.port), SearchHandler)
+    print(f"🔎 Search service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
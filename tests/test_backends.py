@@ -0,0 +1,92 @@
+# File: tests/test_backends.py
+import os
+import numpy as np
+import pytest
+from ml_engine.backends import NumpyBackend, _MemmapCollection
+
+DIM = 32
+
+def make_backend(tmp_path, **options):
+    backend = NumpyBackend(str(tmp_path / "vector_db"), **options)
+    backend.ensure_collection("c", DIM)
+    return backend
+
+def upload(backend, rng, n, video_id, first_id=0):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    backend.upload("c", vectors, [{"video_id": video_id, "i": i} for i in range(n)],
+                   ids=[f"{video_id}-{first_id + i}" for i in range(n)])
+    return vectors
+
+def brute_force(vectors, query, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return set(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k])
+
+@pytest.mark.parametrize("dtype,keep_full", [("float16", True), ("float16", False), ("int8", True), ("int8", False)])
+def test_recall_against_brute_force(tmp_path, dtype, keep_full):
+    rng = np.random.default_rng(0)
+    backend = make_backend(tmp_path, dtype=dtype, keep_full=keep_full)
+    # More rows than one scoring block, in several uploads
+    vectors = np.concatenate([upload(backend, rng, 3000, f"v{i}", first_id=0) for i in range(3)])
+    recalls = []
+    for _ in range(20):
+        query = rng.standard_normal(DIM)
+        hits = backend.search("c", query, 10)
+        rows = {int(h.payload["video_id"][1:]) * 3000 + h.payload["i"] for h in hits}
+        recalls.append(len(rows & brute_force(vectors, query, 10)) / 10)
+    assert np.mean(recalls) >= (0.99 if keep_full else 0.9)
+
+def test_video_filter_only_returns_that_video(tmp_path):
+    rng = np.random.default_rng(1)
+    backend = make_backend(tmp_path)
+    for i in range(8):
+        upload(backend, rng, 200, f"v{i}")
+    hits = backend.search("c", rng.standard_normal(DIM), 20, video_ids="v3")
+    assert len(hits) == 20 and {h.payload["video_id"] for h in hits} == {"v3"}
+    assert backend.search("c", rng.standard_normal(DIM), 5, video_ids="missing") == []
+
+def test_upsert_replaces_rows(tmp_path):
+    rng = np.random.default_rng(2)
+    backend = make_backend(tmp_path)
+    upload(backend, rng, 10, "a")
+    target = rng.standard_normal(DIM).astype(np.float32)
+    backend.upload("c", target[None], [{"video_id": "a", "i": "new"}], ids=["a-3"])
+    assert backend.count("c") == 10
+    best = backend.search("c", target, 1)[0]
+    assert best.id == "a-3" and best.payload["i"] == "new"
+    # Survives a reopen
+    reopened = make_backend(tmp_path)
+    assert reopened.count("c") == 10 and reopened.search("c", target, 1)[0].payload["i"] == "new"
+
+def test_compaction_keeps_live_rows(tmp_path):
+    rng = np.random.default_rng(3)
+    backend = make_backend(tmp_path)
+    upload(backend, rng, 50, "a")
+    kept = upload(backend, rng, 20, "b")
+    backend.delete_video("c", "a")
+    collection = backend.collections["c"]
+    # More than half the rows were dead, so the files were rewritten
+    assert collection.meta["count"] == 20 and len(collection.payloads) == 20
+    assert backend.count("c", "a") == 0 and backend.count("c", "b") == 20
+    for i in (0, 7, 19):
+        assert backend.search("c", kept[i], 1)[0].id == f"b-{i}"
+    upload(backend, rng, 5, "a")
+    assert make_backend(tmp_path).count("c") == 25
+
+def test_half_written_append_is_truncated_on_open(tmp_path):
+    rng = np.random.default_rng(4)
+    backend = make_backend(tmp_path, dtype="int8")
+    upload(backend, rng, 5, "a")
+    folder = str(tmp_path / "vector_db" / "c")
+    # Crash after some files got the new rows but before meta.json was saved
+    with open(os.path.join(folder, "vectors.bin"), "ab") as f:
+        f.write(b"\0" * 3 * DIM)
+    with open(os.path.join(folder, "payloads.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"video_id": "orphan"}\n{"video_')
+
+    backend = make_backend(tmp_path, dtype="int8")
+    new_rows = upload(backend, rng, 2, "b")
+    collection = _MemmapCollection(folder, DIM, "int8", True)
+    assert collection.meta["count"] == 7
+    assert [p["video_id"] for p in collection.payloads] == ["a"] * 5 + ["b"] * 2
+    assert os.path.getsize(os.path.join(folder, "vectors.bin")) == 7 * DIM
+    assert backend.search("c", new_rows[1], 1)[0].id == "b-1"
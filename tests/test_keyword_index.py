@@ -0,0 +1,37 @@
+# File: tests/test_keyword_index.py
+from ml_engine.keyword_index import KeywordIndex
+
+def segments(*texts):
+    return [{"id": i, "start": float(i), "end": i + 1.0, "text": t} for i, t in enumerate(texts)]
+
+def videos(results):
+    return sorted(doc["video_id"] for _, doc in results)
+
+def test_phrase_needs_every_word_in_order(tmp_path):
+    index = KeywordIndex(str(tmp_path / "k.pkl"))
+    index.add_video("a", segments("the red house"))
+    index.add_video("b", segments("a red car passes"))
+    assert index.search('"red car"') and videos(index.search('"red car"')) == ["b"]
+    assert index.search('"car red"') == []
+
+def test_reingest_does_not_grow_the_snapshot(tmp_path):
+    index = KeywordIndex(str(tmp_path / "k.pkl"))
+    for _ in range(5):
+        index.add_video("a", segments("first line", "second line"))
+        index.save()
+    assert len(index.docs) == 2 and index.live_docs == 2
+    reloaded = KeywordIndex(str(tmp_path / "k.pkl"))
+    assert videos(reloaded.search("second")) == ["a"]
+
+def test_processes_see_each_others_writes_across_snapshots(tmp_path):
+    path = str(tmp_path / "k.pkl")
+    first, second = KeywordIndex(path), KeywordIndex(path)
+    first.add_video("a", segments("alpha"))
+    # second folds the log into a new snapshot while first still holds the old one
+    second.add_video("b", segments("beta"))
+    second.save()
+    second.add_video("c", segments("gamma"))
+    assert videos(first.search("alpha beta gamma")) == ["a", "b", "c"]
+    first.add_video("d", segments("delta"))
+    assert videos(second.search("alpha beta gamma delta")) == ["a", "b", "c", "d"]
+    assert videos(KeywordIndex(path).search("alpha beta gamma delta")) == ["a", "b", "c", "d"]